@@ -10,7 +10,14 @@ from utils.version_utils import get_full_version_string
 from config.config_loader import config_loader
 from db.database import db
 
-app = FastAPI(title="TQSync Admin API")
+# 已安装 orjson 时使用其序列化响应，否则回退到标准 JSONResponse
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultResponse
+
+app = FastAPI(title="TQSync Admin API", default_response_class=DefaultResponse)
 
 # 增加 CORS 支持
 app.add_middleware(
@@ -54,31 +61,27 @@ class BindingUpdate(BaseModel):
 @app.post("/admin/restart", dependencies=[Depends(require_permission(PERM_LEVEL_ADMIN))])
 async def trigger_restart():
     from main import graceful_restart
-    # 异步触发重启，避免 API 请求因进程关闭而报错
-    asyncio.create_task(graceful_restart())
+    # 仅设置重启信号，实际关闭由主协程完成，不会阻塞本次响应
+    graceful_restart()
     return {"status": "restarting", "message": "系统正在优雅重启..."}
 
 @app.get("/admin/status", dependencies=[Depends(require_permission(PERM_LEVEL_USER))])
 async def get_status():
-    try:
-        from main import GLOBAL_START_TIME
-        current_start_time = GLOBAL_START_TIME
-        # 简单的合理性检查：如果时间戳小于 2024-01-01，则认为无效
-        if current_start_time < 1704067200:
-            raise ValueError("Invalid start_time detected")
-    except (ImportError, AttributeError, ValueError):
-        current_start_time = time.time()
-        
-    uptime_seconds = int(time.time() - current_start_time)
-    if uptime_seconds < 0: uptime_seconds = 0
+    from main import GLOBAL_START_TIME
+    # 单调时钟差值不会为负，也不受系统时间调整影响
+    uptime_seconds = int(time.monotonic() - GLOBAL_START_TIME)
     hours, remainder = divmod(uptime_seconds, 3600)
     minutes, seconds = divmod(remainder, 60)
+    # 版本号需调用 git 子进程，放入线程池并与数据库查询并发执行
+    version, bound_users = await asyncio.gather(
+        asyncio.get_running_loop().run_in_executor(None, get_full_version_string),
+        db.count_bindings()
+    )
     
-    bindings = await db.get_all_bindings()
     return {
-        "version": get_full_version_string(),
+        "version": version,
         "uptime": f"{hours}h {minutes}m {seconds}s",
-        "bound_users": len(bindings),
+        "bound_users": bound_users,
         "qq_group_id": config_loader.get('qq.group_id'),
         "tg_group_id": config_loader.get('telegram.group_id')
     }
@@ -105,8 +108,11 @@ def update_config(config_key: str, update: ConfigUpdate):
 
 @app.get("/admin/bindings", dependencies=[Depends(require_permission(PERM_LEVEL_ADMIN))])
 async def get_bindings():
-    bindings = await db.get_all_bindings()
-    return [{"tg_user_id": b[0], "qq_user_id": b[1], "tg_username": b[2], "qq_nickname": b[3]} for b in bindings]
+    # 只查询需要的四列并逐行构造响应，不先物化整张表
+    return [
+        {"tg_user_id": b[0], "qq_user_id": b[1], "tg_username": b[2], "qq_nickname": b[3]}
+        async for b in db.iter_bindings('tg_user_id, qq_user_id, tg_username, qq_nickname')
+    ]
 
 @app.delete("/admin/bindings/{tg_user_id}", dependencies=[Depends(require_permission(PERM_LEVEL_ADMIN))])
 async def delete_binding(tg_user_id: int):
@@ -138,5 +144,6 @@ async def toggle_admin(user_id: int):
         admins.append(user_id)
         msg = f"已将用户 {user_id} 设为管理员"
     
-    config_loader.update_config('server.admin_user_ids', admins)
+    # 写回 YAML 文件为阻塞 I/O，放入线程池执行
+    await asyncio.get_running_loop().run_in_executor(None, config_loader.update_config, 'server.admin_user_ids', admins)
     return {"status": "success", "message": msg, "admins": admins}
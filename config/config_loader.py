@@ -2,10 +2,18 @@ import yaml
 import os
 from typing import Dict, Any
 
+# 优先使用 libyaml 的 C 实现解析/输出，未编译 libyaml 时回退到纯 Python 实现
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
+
 class ConfigLoader:
     def __init__(self, config_path="config.yaml"):
         self.config_path = config_path
         self.config: Dict[str, Any] = {}
+        # 以点分路径为键的扁平索引 (包含中间层 dict)，get 只需一次字典查找
+        self._flat: Dict[str, Any] = {}
         self.load_config()
 
     def load_config(self):
@@ -13,17 +21,24 @@ class ConfigLoader:
             raise FileNotFoundError(f"Config file not found: {self.config_path}")
         
         with open(self.config_path, 'r', encoding='utf-8') as f:
-            self.config = yaml.safe_load(f)
+            self.config = yaml.load(f, Loader=_YamlLoader)
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        flat = {}
+        stack = [('', self.config)]
+        while stack:
+            prefix, node = stack.pop()
+            if not isinstance(node, dict):
+                continue
+            for k, v in node.items():
+                path = f"{prefix}{k}"
+                flat[path] = v
+                stack.append((f"{path}.", v))
+        self._flat = flat
 
     def get(self, key: str, default=None):
-        keys = key.split('.')
-        value = self.config
-        for k in keys:
-            if isinstance(value, dict):
-                value = value.get(k, default)
-            else:
-                return default
-        return value
+        return self._flat.get(key, default)
 
     def update_config(self, key: str, value: Any):
         keys = key.split('.')
@@ -33,11 +48,12 @@ class ConfigLoader:
                 current[k] = {}
             current = current[k]
         current[keys[-1]] = value
+        self._rebuild_index()
         self.save_config()
 
     def save_config(self):
         with open(self.config_path, 'w', encoding='utf-8') as f:
-            yaml.dump(self.config, f, allow_unicode=True)
+            yaml.dump(self.config, f, Dumper=_YamlDumper, allow_unicode=True)
 
 # 全局配置实例
 config_loader = ConfigLoader()
@@ -1,26 +1,80 @@
 from telegram import Bot
+import asyncio
 import logging
 import os
+import stat
+import time
 import uuid
 import aiohttp
-import subprocess
-from datetime import datetime
-from utils.version_utils import get_full_version_string
+from collections import OrderedDict
+from typing import Union
+from utils.version_utils import get_full_version_string, get_last_update_time
 from config.config_loader import config_loader
-from handlers.qq_handler import onebot_client
+from handlers.qq_handler import onebot_client, get_message_id
 from db.database import db
 
 logger = logging.getLogger(__name__)
 
+# 下载时单次读取的块大小 (64 KiB)，减少循环次数
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# 超过该大小且服务器支持 Range 请求时，分段并发下载
+PARALLEL_DOWNLOAD_THRESHOLD = 10 * 1024 * 1024
+PARALLEL_DOWNLOAD_PARTS = 4
+# 不超过该大小的 QQ 媒体直接在内存中转发给 Telegram，不写入临时文件
+IN_MEMORY_MEDIA_MAX = 5 * 1024 * 1024
+
+def _stat_file(path: str):
+    """单次 os.stat 同时获取文件是否存在及大小，返回 (exists, size)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False, 0
+    return stat.S_ISREG(st.st_mode), st.st_size
+
+# file_id -> 下载链接 缓存容量与有效期 (Telegram 文件链接保证至少 1 小时有效)
+FILE_URL_CACHE_MAX = 2048
+FILE_URL_CACHE_TTL = 3000
+
+# 合并发往 Telegram 的纯文本消息时的最大长度 (Telegram 单条上限 4096 字符)
+TG_MAX_MERGED_LENGTH = 3900
+
+# Telegram 媒体参数名 -> Bot 发送方法名
+_TG_SEND_METHODS = {
+    'photo': 'send_photo',
+    'video': 'send_video',
+    'document': 'send_document',
+}
+
+# QQ 消息段类型 -> (临时文件名前缀, 默认扩展名, 日志名称, 发送者提示模板)
+_QQ_MEDIA_TYPES = {
+    'image': ('img_', '.jpg', '图片', "[TG] {nickname}\n"),
+    'video': ('vid_', '.mp4', '视频', "[TG] {nickname} 发送了一个视频\n"),
+    'file': ('file_', '', '文件', "[TG] {nickname} 发送了一个文件: {filename}\n"),
+}
+
 class SyncEngine:
+    __slots__ = ('bot', 'tg_group_id', 'qq_group_id', '_file_url_cache', '_file_url_pending',
+                 '_coalesce_window', '_tg_send_queue', '_tg_writer_task', '_media_semaphore')
     _instance = None
 
     def __init__(self, bot: Bot):
         if SyncEngine._instance is not None:
             return
         self.bot = bot
-        self.tg_group_id = config_loader.get('telegram.group_id')
-        self.qq_group_id = config_loader.get('qq.group_id')
+        # 统一转为 int 并缓存，避免每条消息都查询配置与做类型转换
+        self.tg_group_id = int(config_loader.get('telegram.group_id'))
+        self.qq_group_id = int(config_loader.get('qq.group_id'))
+        # file_id -> (下载链接, 获取时间)，LRU 淘汰
+        self._file_url_cache = OrderedDict()
+        # 正在获取中的 file_id，相同文件的并发请求只调用一次 get_file
+        self._file_url_pending = {}
+        # 纯文本消息合并窗口 (秒)，为 0 时不合并，逐条发送
+        self._coalesce_window = config_loader.get('telegram.coalesce_window_ms', 0) / 1000
+        # 发送队列与写协程在首次需要合并发送时创建
+        self._tg_send_queue = None
+        self._tg_writer_task = None
+        # 双向媒体转发共用的并发上限
+        self._media_semaphore = asyncio.Semaphore(config_loader.get('sync.max_concurrent_media', 8))
         SyncEngine._instance = self
 
     @classmethod
@@ -29,13 +83,16 @@ class SyncEngine:
             raise RuntimeError("SyncEngine has not been initialized. Call SyncEngine(bot) first.")
         return cls._instance
 
-    async def _download_to_temp(self, file_url: str, filename: str) -> str:
-        """下载文件到 temp 目录并返回本地绝对路径"""
+    async def _download_to_temp(self, file_url: str, filename: str, memory_limit: int = 0) -> Union[str, bytes]:
+        """
+        下载文件到 temp 目录并返回本地绝对路径。
+        若响应声明的大小不超过 memory_limit，则直接返回文件内容 (bytes)，不写入磁盘。
+        """
         temp_dir = os.path.join(os.getcwd(), 'temp')
         os.makedirs(temp_dir, exist_ok=True)
         
         file_path = os.path.join(temp_dir, filename)
-        logger.info(f"正在下载文件至本地中转: {file_path}")
+        logger.info("正在下载文件至本地中转: %s", file_path)
         
         # 全局禁用 SSL 验证以适配国内代理环境
         connector = aiohttp.TCPConnector(ssl=False)
@@ -43,22 +100,86 @@ class SyncEngine:
             async with session.get(file_url) as resp:
                 if resp.status != 200:
                     raise Exception(f"Download failed with status {resp.status}")
-                with open(file_path, 'wb') as f:
-                    while True:
-                        chunk = await resp.content.read(8192)
-                        if not chunk:
-                            break
-                        f.write(chunk)
+                size = resp.content_length or 0
+                if 0 < size <= memory_limit:
+                    return await resp.read()
+                ranged = (size > PARALLEL_DOWNLOAD_THRESHOLD
+                          and resp.headers.get('Accept-Ranges', '').lower() == 'bytes')
+                if ranged:
+                    # 大文件改为分段下载，放弃当前响应体
+                    resp.close()
+                else:
+                    with open(file_path, 'wb') as f:
+                        async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+            if ranged:
+                await self._download_ranges(session, file_url, file_path, size)
         return os.path.abspath(file_path)
 
+    async def _download_ranges(self, session: aiohttp.ClientSession, file_url: str, file_path: str, size: int):
+        """按字节范围分段并发下载，各段直接写入预分配文件的对应偏移"""
+        logger.info("文件较大 (%d 字节)，分 %d 段并发下载", size, PARALLEL_DOWNLOAD_PARTS)
+        with open(file_path, 'wb') as f:
+            f.truncate(size)
+
+        async def fetch_range(start: int, end: int):
+            async with session.get(file_url, headers={'Range': f'bytes={start}-{end}'}) as resp:
+                if resp.status != 206:
+                    raise Exception(f"Range download failed with status {resp.status}")
+                with open(file_path, 'r+b') as f:
+                    f.seek(start)
+                    async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+
+        part_size = -(-size // PARALLEL_DOWNLOAD_PARTS)
+        tasks = [
+            asyncio.ensure_future(fetch_range(start, min(start + part_size, size) - 1))
+            for start in range(0, size, part_size)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一分段失败时取消其余分段，避免其在会话关闭后继续写入
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _get_file_url(self, file_id: str) -> str:
+        """获取 Telegram 文件下载链接，带 LRU 缓存与并发去重"""
+        cached = self._file_url_cache.get(file_id)
+        if cached and time.monotonic() - cached[1] < FILE_URL_CACHE_TTL:
+            self._file_url_cache.move_to_end(file_id)
+            return cached[0]
+
+        pending = self._file_url_pending.get(file_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch_file_url(file_id))
+            self._file_url_pending[file_id] = pending
+            pending.add_done_callback(lambda _: self._file_url_pending.pop(file_id, None))
+        # shield: 单个调用方被取消时不影响其他等待同一文件的调用方
+        return await asyncio.shield(pending)
+
+    async def _fetch_file_url(self, file_id: str) -> str:
+        file = await self.bot.get_file(file_id)
+        file_url = file.file_path
+        if not file_url.startswith("http"):
+            file_url = f"https://api.telegram.org/file/bot{self.bot.token}/{file_url}"
+
+        self._file_url_cache[file_id] = (file_url, time.monotonic())
+        self._file_url_cache.move_to_end(file_id)
+        if len(self._file_url_cache) > FILE_URL_CACHE_MAX:
+            self._file_url_cache.popitem(last=False)
+        return file_url
+
     def _cleanup_temp(self, file_path: str):
         """清理临时文件"""
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                logger.info(f"已清理临时文件: {file_path}")
+                logger.info("已清理临时文件: %s", file_path)
         except Exception as e:
-            logger.warning(f"清理临时文件失败 {file_path}: {e}")
+            logger.warning("清理临时文件失败 %s: %s", file_path, e)
 
     async def get_display_name(self, tg_user_id: int = None, qq_user_id: int = None, fallback_name: str = "Unknown"):
         """根据绑定关系获取统一显示名称，优先使用自定义前缀"""
@@ -82,178 +203,117 @@ class SyncEngine:
 
     async def forward_image_to_qq(self, tg_user_id: int, tg_username: str, file_id: str, caption: str = ""):
         """将 Telegram 图片转发到 QQ (本地文件中转方案，支持 Caption 图文混排)"""
-        binding = await db.get_binding_by_tg(tg_user_id)
-        nickname = binding[3] if binding and binding[3] else tg_username
-        temp_path = None
-        
-        try:
-            # 1. 获取 Telegram 文件链接
-            file = await self.bot.get_file(file_id)
-            file_url = file.file_path
-            if not file_url.startswith("http"):
-                file_url = f"https://api.telegram.org/file/bot{self.bot.token}/{file_url}"
-            
-            # 2. 下载到本地 temp
-            ext = os.path.splitext(file_url)[1] or '.jpg'
-            temp_filename = f"img_{uuid.uuid4().hex}{ext}"
-            temp_path = await self._download_to_temp(file_url, temp_filename)
-            
-            # 3. 构造消息段 (实现图文混排：文字在上，图片在下)
-            message_array = [
-                {"type": "text", "data": {"text": f"[TG] {nickname}\n"}},
-            ]
-            
-            # 如果有 Caption，则添加在图片上方
-            if caption:
-                message_array.append({"type": "text", "data": {"text": f"{caption}\n"}})
-            
-            message_array.append({"type": "image", "data": {"file": temp_path}})
-            
-            result = await onebot_client.send_group_msg(self.qq_group_id, message_array)
-            logger.info(f"图片已成功发送至 QQ。结果: {result}")
-            return result
-
-        except Exception as e:
-            logger.error(f"转发图片至 QQ 失败: {e}", exc_info=True)
-            return None
-        finally:
-            if temp_path:
-                self._cleanup_temp(temp_path)
+        return await self._forward_media_to_qq('image', tg_user_id, tg_username, file_id, caption=caption)
 
     async def forward_video_to_qq(self, tg_user_id: int, tg_username: str, file_id: str):
         """将 Telegram 视频转发到 QQ"""
-        binding = await db.get_binding_by_tg(tg_user_id)
-        nickname = binding[3] if binding and binding[3] else tg_username
-        temp_path = None
-        
-        try:
-            file = await self.bot.get_file(file_id)
-            file_url = file.file_path
-            if not file_url.startswith("http"):
-                file_url = f"https://api.telegram.org/file/bot{self.bot.token}/{file_url}"
-            
-            ext = os.path.splitext(file_url)[1] or '.mp4'
-            temp_filename = f"vid_{uuid.uuid4().hex}{ext}"
-            temp_path = await self._download_to_temp(file_url, temp_filename)
-            
-            message_array = [
-                {"type": "text", "data": {"text": f"[TG] {nickname} 发送了一个视频\n"}},
-                {"type": "video", "data": {"file": temp_path}}
-            ]
-            
-            result = await onebot_client.send_group_msg(self.qq_group_id, message_array)
-            logger.info(f"视频已成功发送至 QQ。结果: {result}")
-            return result
-
-        except Exception as e:
-            logger.error(f"转发视频至 QQ 失败: {e}", exc_info=True)
-            return None
-        finally:
-            if temp_path:
-                self._cleanup_temp(temp_path)
+        return await self._forward_media_to_qq('video', tg_user_id, tg_username, file_id)
 
     async def forward_file_to_qq(self, tg_user_id: int, tg_username: str, file_id: str, filename: str):
         """将 Telegram 通用文件转发到 QQ (卡片形式)"""
+        return await self._forward_media_to_qq('file', tg_user_id, tg_username, file_id, filename=filename)
+
+    async def _forward_media_to_qq(self, media_type: str, tg_user_id: int, tg_username: str, file_id: str, caption: str = "", filename: str = None):
+        """通用 Telegram 媒体转发到 QQ 方法 (下载到本地 temp 后以本地路径发送)"""
+        temp_prefix, default_ext, label, header_template = _QQ_MEDIA_TYPES[media_type]
         binding = await db.get_binding_by_tg(tg_user_id)
         nickname = binding[3] if binding and binding[3] else tg_username
         temp_path = None
         
-        try:
-            file = await self.bot.get_file(file_id)
-            file_url = file.file_path
-            if not file_url.startswith("http"):
-                file_url = f"https://api.telegram.org/file/bot{self.bot.token}/{file_url}"
+        # 限制同时进行的媒体下载/上传数量，避免占满带宽拖慢文本消息
+        async with self._media_semaphore:
+            try:
+                # 1. 获取 Telegram 文件链接 (带缓存)
+                file_url = await self._get_file_url(file_id)
             
-            ext = os.path.splitext(filename)[1]
-            temp_filename = f"file_{uuid.uuid4().hex}{ext}"
-            temp_path = await self._download_to_temp(file_url, temp_filename)
+                # 2. 下载到本地 temp (返回值已是绝对路径)
+                ext = os.path.splitext(filename or file_url)[1] or default_ext
+                temp_filename = f"{temp_prefix}{uuid.uuid4().hex}{ext}"
+                temp_path = await self._download_to_temp(file_url, temp_filename)
             
-            message_array = [
-                {"type": "text", "data": {"text": f"[TG] {nickname} 发送了一个文件: {filename}\n"}},
-                {"type": "file", "data": {"file": temp_path}}
-            ]
+                # 3. 构造消息段 (文字在上，媒体在下)
+                header = header_template.format(nickname=nickname, filename=filename)
+                message_array = [{"type": "text", "data": {"text": header}}]
+                # 如果有 Caption (仅图片)，则添加在媒体上方
+                if caption:
+                    message_array.append({"type": "text", "data": {"text": f"{caption}\n"}})
+                message_array.append({"type": media_type, "data": {"file": temp_path}})
             
-            result = await onebot_client.send_group_msg(self.qq_group_id, message_array)
-            logger.info(f"文件已成功发送至 QQ。结果: {result}")
-            return result
+                result = await onebot_client.send_group_msg(self.qq_group_id, message_array)
+                logger.info("%s已发送至 QQ (message_id: %s)", label, get_message_id(result))
+                return result
 
-        except Exception as e:
-            logger.error(f"转发文件至 QQ 失败: {e}", exc_info=True)
-            return None
-        finally:
-            if temp_path:
-                self._cleanup_temp(temp_path)
+            except Exception as e:
+                logger.error("转发%s至 QQ 失败: %s", label, e, exc_info=True)
+                return None
+            finally:
+                if temp_path:
+                    self._cleanup_temp(temp_path)
 
     async def forward_image_to_tg(self, qq_user_id: int, qq_nickname: str, image_url: str, caption: str = "", reply_to_message_id: int = None):
         """将 QQ 图片转发到 Telegram (支持本地文件中转)"""
-        binding = await db.get_binding_by_qq(qq_user_id)
-        prefix = f"[QQ] {binding[2] or qq_nickname}" if binding else f"[QQ] {qq_nickname}"
-        full_caption = f"{prefix}\n{caption}" if caption else prefix
-        await self._send_file_to_tg(qq_user_id, qq_nickname, image_url, self.bot.send_photo, "photo", caption=full_caption, reply_to_message_id=reply_to_message_id)
+        await self._send_file_to_tg(qq_user_id, qq_nickname, image_url, "photo", text=caption, reply_to_message_id=reply_to_message_id)
 
     async def forward_video_to_tg(self, qq_user_id: int, qq_nickname: str, video_url: str, caption: str = "", reply_to_message_id: int = None):
         """将 QQ 视频转发到 Telegram (支持本地文件中转)"""
-        binding = await db.get_binding_by_qq(qq_user_id)
-        prefix = f"[QQ] {binding[2] or qq_nickname}" if binding else f"[QQ] {qq_nickname}"
-        full_caption = f"{prefix}\n{caption}" if caption else prefix
-        await self._send_file_to_tg(qq_user_id, qq_nickname, video_url, self.bot.send_video, "video", caption=full_caption, reply_to_message_id=reply_to_message_id)
+        await self._send_file_to_tg(qq_user_id, qq_nickname, video_url, "video", text=caption, reply_to_message_id=reply_to_message_id)
 
     async def forward_file_to_tg(self, qq_user_id: int, qq_nickname: str, file_url: str, file_name: str = "file", reply_to_message_id: int = None):
         """将 QQ 文件转发到 Telegram (支持本地文件中转)"""
-        await self._send_file_to_tg(qq_user_id, qq_nickname, file_url, self.bot.send_document, "document", filename=file_name, reply_to_message_id=reply_to_message_id)
+        await self._send_file_to_tg(qq_user_id, qq_nickname, file_url, "document", filename=file_name, reply_to_message_id=reply_to_message_id)
 
-    async def _send_file_to_tg(self, qq_user_id: int, qq_nickname: str, file_url: str, send_func, file_key: str, **kwargs):
-        """通用文件转发到 Telegram 方法，支持本地路径中转"""
+    async def _send_file_to_tg(self, qq_user_id: int, qq_nickname: str, file_url: str, file_key: str, text: str = "", **kwargs):
+        """通用文件转发到 Telegram 方法，支持本地路径中转。caption 为发送者前缀加上附带文字"""
+        # 每次转发只查询一次绑定关系
         binding = await db.get_binding_by_qq(qq_user_id)
         prefix = f"[QQ] {binding[2] or qq_nickname}" if binding else f"[QQ] {qq_nickname}"
-        temp_path = None
-        
-        try:
-            # 判断是否为本地路径或内网地址
-            if file_url.startswith(("file:///", "/", "C:\\", "D:\\")) or "127.0.0.1" in file_url or "localhost" in file_url:
-                local_path = file_url.replace("file://", "")
-                if os.path.exists(local_path):
-                    temp_path = local_path
-                else:
-                    raise FileNotFoundError(f"Local file not found: {local_path}")
-            else:
-                temp_path = file_url
+        send_func = getattr(self.bot, _TG_SEND_METHODS[file_key])
+        downloaded_path = None
 
-            # 准备发送参数
-            send_kwargs = {"chat_id": self.tg_group_id, file_key: temp_path}
-            
-            # 合并 caption
-            if "caption" in kwargs:
-                send_kwargs["caption"] = kwargs.pop("caption")
-            else:
-                send_kwargs["caption"] = prefix
-            
-            # 处理回复 ID
-            if "reply_to_message_id" in kwargs:
-                send_kwargs["reply_to_message_id"] = kwargs.pop("reply_to_message_id")
-                
-            send_kwargs.update(kwargs)
+        # 以下仅为字符串与参数拼装，不会抛出异常，放在 try 与信号量之外
+        # 判断是否为本地路径或内网地址
+        if file_url.startswith(("file:///", "/", "C:\\", "D:\\")) or "127.0.0.1" in file_url or "localhost" in file_url:
+            temp_path = file_url.replace("file://", "")
+        else:
+            temp_path = file_url
 
-            # 关键修复：即使是 http URL，如果 Telegram 无法访问（如内网或需代理），也应下载到本地再上传
-            # 我们统一采用“下载到本地 -> 上传给 TG”的策略以确保稳定性
-            if not os.path.exists(temp_path) or temp_path.startswith("http"):
-                # 如果是 URL，先下载到临时文件
+        # 准备发送参数，合并 caption
+        send_kwargs = {"chat_id": self.tg_group_id, file_key: temp_path}
+        send_kwargs["caption"] = f"{prefix}\n{text}" if text else prefix
+        send_kwargs.update(kwargs)
+        
+        # 限制同时进行的媒体下载/上传数量，避免占满带宽拖慢文本消息
+        async with self._media_semaphore:
+            try:
+                # 关键修复：即使是 http URL，如果 Telegram 无法访问（如内网或需代理），也应下载到本地再上传
+                # 我们统一采用“下载到本地 -> 上传给 TG”的策略以确保稳定性
                 if temp_path.startswith("http"):
                     ext = os.path.splitext(temp_path.split('?')[0])[1] or '.tmp'
                     temp_filename = f"forward_{uuid.uuid4().hex}{ext}"
-                    downloaded_path = await self._download_to_temp(temp_path, temp_filename)
-                    temp_path = downloaded_path
+                    downloaded = await self._download_to_temp(temp_path, temp_filename, memory_limit=IN_MEMORY_MEDIA_MAX)
+                    if isinstance(downloaded, bytes):
+                        # 小文件直接以内存数据上传，省去一次磁盘写入与读取
+                        send_kwargs[file_key] = downloaded
+                        await send_func(**send_kwargs)
+                        return
+                    temp_path = downloaded_path = downloaded
 
-            # 以二进制流形式发送给 Telegram
-            if os.path.exists(temp_path):
+                # 在线程池中 stat 一次，避免慢速磁盘阻塞事件循环
+                exists, _ = await asyncio.get_running_loop().run_in_executor(None, _stat_file, temp_path)
+                if not exists:
+                    raise FileNotFoundError(f"File not found for forwarding: {temp_path}")
+
+                # 以二进制流形式发送给 Telegram
                 with open(temp_path, 'rb') as f:
                     send_kwargs[file_key] = f
                     await send_func(**send_kwargs)
-            else:
-                raise FileNotFoundError(f"File not found for forwarding: {temp_path}")
                 
-        except Exception as e:
-            logger.error(f"转发消息至 Telegram 失败: {e}", exc_info=True)
+            except Exception as e:
+                logger.error("转发消息至 Telegram 失败: %s", e, exc_info=True)
+            finally:
+                # 仅清理本方法下载的临时文件，不删除 Napcat 提供的本地文件
+                if downloaded_path:
+                    self._cleanup_temp(downloaded_path)
 
     async def forward_to_qq(self, tg_user_id: int, tg_username: str, text: str):
         display_name = await self.get_display_name(tg_user_id=tg_user_id, fallback_name=tg_username)
@@ -265,35 +325,87 @@ class SyncEngine:
         display_name = await self.get_display_name(qq_user_id=qq_user_id, fallback_name=qq_nickname)
         message = f"[QQ] {display_name}: {text}"
         try:
-            result = await self.bot.send_message(chat_id=self.tg_group_id, text=message, reply_to_message_id=reply_to_message_id)
+            result = await self._send_text_to_tg(message, reply_to_message_id)
             return result
         except Exception as e:
-            print(f"Error sending to TG: {e}")
+            logger.error("Error sending to TG: %s", e)
             return None
 
+    async def _send_text_to_tg(self, text: str, reply_to_message_id: int = None):
+        """
+        发送纯文本消息至 Telegram。
+        开启合并窗口时，非回复消息进入队列，窗口内的相邻消息合并为一条发送；
+        被合并的消息返回 None (不建立撤回/回复映射)。
+        """
+        if self._coalesce_window <= 0 or reply_to_message_id is not None:
+            return await self.bot.send_message(chat_id=self.tg_group_id, text=text, reply_to_message_id=reply_to_message_id)
+
+        if self._tg_send_queue is None:
+            self._tg_send_queue = asyncio.Queue()
+        if self._tg_writer_task is None or self._tg_writer_task.done():
+            self._tg_writer_task = asyncio.create_task(self._tg_writer_loop())
+
+        fut = asyncio.get_running_loop().create_future()
+        self._tg_send_queue.put_nowait((text, fut))
+        return await fut
+
+    async def _tg_writer_loop(self):
+        """合并发送队列的消费者：等待一个窗口期后取出积压消息，合并为一条发送"""
+        carry = None
+        while True:
+            if carry is None:
+                carry = await self._tg_send_queue.get()
+                await asyncio.sleep(self._coalesce_window)
+            text, fut = carry
+            carry = None
+            texts, futures = [text], [fut]
+            length = len(text)
+            while not self._tg_send_queue.empty():
+                item = self._tg_send_queue.get_nowait()
+                length += len(item[0]) + 1
+                if length > TG_MAX_MERGED_LENGTH:
+                    # 超出长度的消息留到下一批发送
+                    carry = item
+                    break
+                texts.append(item[0])
+                futures.append(item[1])
+
+            try:
+                result = await self.bot.send_message(chat_id=self.tg_group_id, text="\n".join(texts))
+            except Exception as e:
+                for f in futures:
+                    if not f.done():
+                        f.set_exception(e)
+            else:
+                # 合并发送的 TG 消息包含多条 QQ 消息 (可能来自不同用户)，不能与其中任何一条建立映射，
+                # 否则撤回其中一条会删除整条合并消息；此时返回 None，调用方不保存映射
+                if len(futures) > 1:
+                    result = None
+                for f in futures:
+                    if not f.done():
+                        f.set_result(result)
+
+    async def close(self):
+        """停止合并发送协程"""
+        if self._tg_writer_task is not None:
+            self._tg_writer_task.cancel()
+            self._tg_writer_task = None
+
     async def send_startup_notification(self):
         """向两个平台发送启动成功通知"""
         
-        # 1. 获取最后更新时间
-        last_update = "Unknown"
-        try:
-            result = subprocess.run(['git', 'log', '-1', '--format=%ci'], 
-                                    capture_output=True, text=True, check=True)
-            git_time_str = result.stdout.strip()
-            last_update = git_time_str.split('+')[0].strip()
-        except Exception:
-            try:
-                mtime = os.path.getmtime('main.py')
-                last_update = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                pass
+        # 1. 获取最后更新时间与版本号 (git 子进程放入线程池并发执行，避免阻塞事件循环)
+        loop = asyncio.get_running_loop()
+        last_update, version_str = await asyncio.gather(
+            loop.run_in_executor(None, get_last_update_time),
+            loop.run_in_executor(None, get_full_version_string)
+        )
 
         # 2. 获取配置信息
         qq_gid = config_loader.get('qq.group_id')
         tg_gid = config_loader.get('telegram.group_id')
 
         # 3. 构造消息
-        version_str = get_full_version_string()
         message = (
             f"🚀 TQSync {version_str} 已成功启动并正在运行！\n"
             f"--------------------------\n"
@@ -303,19 +415,16 @@ class SyncEngine:
             f"--------------------------"
         )
         
-        # 4. 发送通知
-        # 发送到 Telegram
-        try:
-            await self.bot.send_message(chat_id=self.tg_group_id, text=message)
-            logger.info("Startup notification sent to Telegram.")
-        except Exception as e:
-            logger.error(f"Failed to send startup notification to Telegram: {e}")
-            
-        # 发送到 QQ
-        try:
-            await onebot_client.send_group_msg(self.qq_group_id, message)
-            logger.info("Startup notification sent to QQ.")
-        except Exception as e:
-            logger.error(f"Failed to send startup notification to QQ: {e}")
+        # 4. 同时发送到 Telegram 与 QQ，两端互不等待
+        tg_result, qq_result = await asyncio.gather(
+            self.bot.send_message(chat_id=self.tg_group_id, text=message),
+            onebot_client.send_group_msg(self.qq_group_id, message),
+            return_exceptions=True
+        )
+        for platform, result in (("Telegram", tg_result), ("QQ", qq_result)):
+            if isinstance(result, Exception):
+                logger.error("Failed to send startup notification to %s: %s", platform, result)
+            else:
+                logger.info("Startup notification sent to %s.", platform)
 
 sync_engine = None  # Will be initialized in main.py with the bot instance
@@ -1,86 +1,228 @@
 import aiosqlite
+import asyncio
+import logging
 import os
 import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from config.config_loader import config_loader
 
+logger = logging.getLogger(__name__)
+
 class Database:
+    # 消息映射批量写入：攒批等待时间 (秒) 与单批最大条数
+    MAPPING_FLUSH_INTERVAL = 0.1
+    MAPPING_BATCH_SIZE = 128
+    # 过期映射清理：单批删除的最大条数
+    PRUNE_BATCH_SIZE = 1000
+    # 绑定关系读缓存 (LRU) 的最大条目数
+    BINDING_CACHE_MAX = 4096
+
     def __init__(self):
         self.db_path = config_loader.get('database.path', 'db/tqsync.db')
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # 映射写入队列与写协程在首次保存映射时创建 (需要运行中的事件循环)
+        self._mapping_queue = None
+        self._mapping_writer = None
+        # 长连接：首次使用时打开，之后所有查询复用，省去每次打开文件与加锁的开销
+        self._conn = None
+        self._conn_pending = None
+        # 共享连接上的写事务必须串行，否则一个协程的 commit/rollback 会波及另一个协程未完成的写入
+        self._write_lock = None
+        # 绑定关系很少变化，却在每条消息上查询：缓存查询结果 (含未绑定的 None)，任何绑定写入时整体失效
+        self._binding_cache = OrderedDict()
+        self._binding_generation = 0
 
-    async def init_db(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS bindings (
-                    tg_user_id INTEGER PRIMARY KEY,
-                    qq_user_id INTEGER UNIQUE,
-                    tg_username TEXT,
-                    qq_nickname TEXT,
-                    uid TEXT,
-                    custom_prefix TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            # 尝试添加新列以兼容旧数据库
+    async def _connection(self) -> aiosqlite.Connection:
+        """返回共享连接，并发的首次调用只会打开一次"""
+        if self._conn is not None:
+            return self._conn
+        pending = self._conn_pending
+        if pending is None:
+            pending = self._conn_pending = asyncio.ensure_future(self._open_connection())
+        try:
+            return await asyncio.shield(pending)
+        finally:
+            # 多个等待者共享同一个 future，只由第一个恢复的清除，且不清除之后新建的 future
+            if self._conn_pending is pending and pending.done():
+                self._conn_pending = None
+
+    async def _open_connection(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path)
+        # WAL 模式下读写互不阻塞，synchronous=NORMAL 在 WAL 下仍可保证不损坏数据库
+        await conn.execute('PRAGMA journal_mode=WAL')
+        await conn.execute('PRAGMA synchronous=NORMAL')
+        await conn.execute('PRAGMA temp_store=MEMORY')
+        self._write_lock = asyncio.Lock()
+        self._conn = conn
+        return conn
+
+    @asynccontextmanager
+    async def transaction(self):
+        """写事务：BEGIN IMMEDIATE 开始，正常退出时提交、异常时回滚，块内多条语句只提交一次。
+        读操作不经过此锁，且与写事务共用同一连接，因此事务期间的读能看到尚未提交的写入 (并非隔离)"""
+        db = await self._connection()
+        async with self._write_lock:
+            await db.execute('BEGIN IMMEDIATE')
             try:
-                await db.execute('ALTER TABLE bindings ADD COLUMN uid TEXT')
-                await db.execute('ALTER TABLE bindings ADD COLUMN custom_prefix TEXT')
-            except aiosqlite.OperationalError:
-                pass # 列已存在
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS message_mapping (
-                    local_msg_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    tg_message_id INTEGER,
-                    qq_message_id INTEGER,
-                    sender_tg_id INTEGER,
-                    sender_qq_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+                yield db
+            except BaseException:
+                await db.rollback()
+                raise
             await db.commit()
 
-    async def save_message_mapping(self, tg_message_id: int, qq_message_id: int, sender_tg_id: int = None, sender_qq_id: int = None):
-        """保存双端消息 ID 映射关系"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
+    async def init_db(self):
+        db = await self._connection()
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS bindings (
+                tg_user_id INTEGER PRIMARY KEY,
+                qq_user_id INTEGER UNIQUE,
+                tg_username TEXT,
+                qq_nickname TEXT,
+                uid TEXT,
+                custom_prefix TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # 尝试添加新列以兼容旧数据库
+        try:
+            await db.execute('ALTER TABLE bindings ADD COLUMN uid TEXT')
+            await db.execute('ALTER TABLE bindings ADD COLUMN custom_prefix TEXT')
+        except aiosqlite.OperationalError:
+            pass # 列已存在
+            
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS message_mapping (
+                local_msg_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tg_message_id INTEGER,
+                qq_message_id INTEGER,
+                sender_tg_id INTEGER,
+                sender_qq_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # 回复/撤回按双端消息 ID 查找、过期清理按时间范围删除，均需索引避免全表扫描
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_mapping_tg_msg ON message_mapping(tg_message_id)')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_mapping_qq_msg ON message_mapping(qq_message_id)')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_mapping_created ON message_mapping(created_at)')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_bindings_uid ON bindings(uid)')
+        await db.commit()
+
+    def save_message_mapping(self, tg_message_id: int, qq_message_id: int, sender_tg_id: int = None, sender_qq_id: int = None):
+        """保存双端消息 ID 映射关系 (放入写队列后立即返回，由写协程批量提交)"""
+        if self._mapping_queue is None:
+            self._mapping_queue = asyncio.Queue()
+        if self._mapping_writer is None or self._mapping_writer.done():
+            self._mapping_writer = asyncio.create_task(self._mapping_writer_loop())
+        self._mapping_queue.put_nowait((tg_message_id, qq_message_id, sender_tg_id, sender_qq_id))
+
+    async def _mapping_writer_loop(self):
+        """映射写队列的消费者：短暂攒批后以单个事务写入，收到 None 时写完剩余数据并退出"""
+        while True:
+            row = await self._mapping_queue.get()
+            if row is None:
+                return
+            batch = [row]
+            await asyncio.sleep(self.MAPPING_FLUSH_INTERVAL)
+            stop = False
+            while len(batch) < self.MAPPING_BATCH_SIZE and not self._mapping_queue.empty():
+                row = self._mapping_queue.get_nowait()
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            try:
+                await self._insert_mappings(batch)
+            except Exception as e:
+                logger.error("批量写入消息映射失败 (%d 条): %s", len(batch), e)
+            if stop:
+                return
+
+    async def _insert_mappings(self, rows: list):
+        async with self.transaction() as db:
+            await db.executemany('''
                 INSERT INTO message_mapping (tg_message_id, qq_message_id, sender_tg_id, sender_qq_id)
                 VALUES (?, ?, ?, ?)
-            ''', (tg_message_id, qq_message_id, sender_tg_id, sender_qq_id))
-            await db.commit()
+            ''', rows)
 
     async def get_qq_msg_id_by_tg(self, tg_message_id: int):
         """根据 TG 消息 ID 查找 QQ 消息 ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('SELECT qq_message_id FROM message_mapping WHERE tg_message_id = ?', (tg_message_id,)) as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else None
+        db = await self._connection()
+        async with db.execute('SELECT qq_message_id FROM message_mapping WHERE tg_message_id = ?', (tg_message_id,)) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
 
     async def get_tg_msg_id_by_qq(self, qq_message_id: int):
         """根据 QQ 消息 ID 查找 TG 消息 ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('SELECT tg_message_id FROM message_mapping WHERE qq_message_id = ?', (qq_message_id,)) as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else None
-
-    async def delete_mapping_by_tg(self, tg_message_id: int):
-        """删除映射记录（用于撤回同步）"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('DELETE FROM message_mapping WHERE tg_message_id = ?', (tg_message_id,))
-            await db.commit()
+        db = await self._connection()
+        async with db.execute('SELECT tg_message_id FROM message_mapping WHERE qq_message_id = ?', (qq_message_id,)) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    async def delete_mappings_by_tg(self, tg_message_ids: list):
+        """批量删除映射记录（用于撤回同步），单条语句解析、单次提交"""
+        if not tg_message_ids:
+            return
+        async with self.transaction() as db:
+            await db.executemany('DELETE FROM message_mapping WHERE tg_message_id = ?', [(i,) for i in tg_message_ids])
+
+    async def prune_message_mappings(self, retention_days: int) -> int:
+        """删除超过保留天数的消息映射，防止映射表无限增长，返回删除条数。
+        按批删除并逐批提交，避免大表清理时长时间持有写锁"""
+        cutoff = f'-{int(retention_days)} days'
+        total = 0
+        while True:
+            async with self.transaction() as db:
+                cursor = await db.execute('''
+                    DELETE FROM message_mapping WHERE local_msg_id IN (
+                        SELECT local_msg_id FROM message_mapping
+                        WHERE created_at < datetime('now', ?) LIMIT ?
+                    )
+                ''', (cutoff, self.PRUNE_BATCH_SIZE))
+            total += cursor.rowcount
+            if cursor.rowcount < self.PRUNE_BATCH_SIZE:
+                return total
+
+    async def _cached_fetchone(self, cache_key: tuple, sql: str, params: tuple):
+        """带 LRU 缓存的单行查询，仅用于 bindings 表"""
+        cache = self._binding_cache
+        if cache_key in cache:
+            cache.move_to_end(cache_key)
+            return cache[cache_key]
+        generation = self._binding_generation
+        db = await self._connection()
+        async with db.execute(sql, params) as cursor:
+            row = await cursor.fetchone()
+        # 查询期间发生过写入时不回填，避免缓存旧数据
+        if generation == self._binding_generation:
+            cache[cache_key] = row
+            if len(cache) > self.BINDING_CACHE_MAX:
+                cache.popitem(last=False)
+        return row
+
+    def _invalidate_bindings(self):
+        self._binding_generation += 1
+        self._binding_cache.clear()
+
+    @asynccontextmanager
+    async def _binding_transaction(self):
+        """bindings 表的写事务：开始前与结束后 (无论提交或回滚) 各失效一次缓存。
+        共享连接上的读能看到未提交的写入，事务期间回填的缓存必须在结束时清除"""
+        self._invalidate_bindings()
+        try:
+            async with self.transaction() as db:
+                yield db
+        finally:
+            self._invalidate_bindings()
 
     async def get_binding_by_tg(self, tg_user_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('SELECT * FROM bindings WHERE tg_user_id = ?', (tg_user_id,)) as cursor:
-                return await cursor.fetchone()
+        return await self._cached_fetchone(('tg', tg_user_id), 'SELECT * FROM bindings WHERE tg_user_id = ?', (tg_user_id,))
 
     async def get_binding_by_qq(self, qq_user_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('SELECT * FROM bindings WHERE qq_user_id = ?', (qq_user_id,)) as cursor:
-                return await cursor.fetchone()
+        return await self._cached_fetchone(('qq', qq_user_id), 'SELECT * FROM bindings WHERE qq_user_id = ?', (qq_user_id,))
 
     async def add_binding(self, tg_user_id: int, qq_user_id: int, tg_username: str = None, qq_nickname: str = None):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._binding_transaction() as db:
             # 检查是否已存在 UID，如果不存在则生成一个新的
             existing_uid = None
             if tg_user_id:
@@ -94,44 +236,68 @@ class Database:
             
             final_uid = existing_uid or str(uuid.uuid4())
 
+            # QQ 号已被其他 TG 用户绑定时先解除旧绑定 (与原 INSERT OR REPLACE 行为一致)
+            await db.execute('DELETE FROM bindings WHERE qq_user_id = ? AND tg_user_id != ?', (qq_user_id, tg_user_id))
+            # 原地更新已有行，不再 DELETE + INSERT，保留 custom_prefix 与 created_at
             await db.execute('''
-                INSERT OR REPLACE INTO bindings (tg_user_id, qq_user_id, tg_username, qq_nickname, uid)
+                INSERT INTO bindings (tg_user_id, qq_user_id, tg_username, qq_nickname, uid)
                 VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(tg_user_id) DO UPDATE SET
+                    qq_user_id = excluded.qq_user_id,
+                    tg_username = excluded.tg_username,
+                    qq_nickname = excluded.qq_nickname,
+                    uid = excluded.uid
             ''', (tg_user_id, qq_user_id, tg_username, qq_nickname, final_uid))
-            await db.commit()
 
     async def update_custom_prefix(self, uid: str, prefix: str):
         """根据 UID 更新自定义前缀"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._binding_transaction() as db:
             await db.execute('UPDATE bindings SET custom_prefix = ? WHERE uid = ?', (prefix, uid))
-            await db.commit()
 
     async def get_custom_prefix_by_uid(self, uid: str):
         """根据 UID 获取自定义前缀"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('SELECT custom_prefix FROM bindings WHERE uid = ? LIMIT 1', (uid,)) as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else None
+        row = await self._cached_fetchone(('uid', uid), 'SELECT custom_prefix FROM bindings WHERE uid = ? LIMIT 1', (uid,))
+        return row[0] if row else None
 
     async def delete_binding(self, tg_user_id: int = None, qq_user_id: int = None):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._binding_transaction() as db:
             if tg_user_id:
                 await db.execute('DELETE FROM bindings WHERE tg_user_id = ?', (tg_user_id,))
             elif qq_user_id:
                 await db.execute('DELETE FROM bindings WHERE qq_user_id = ?', (qq_user_id,))
-            await db.commit()
+
+    async def iter_bindings(self, columns: str = '*'):
+        """逐行产出绑定记录，不一次性加载整张表；columns 为查询列 (内部固定字符串，勿传入用户输入)"""
+        db = await self._connection()
+        async with db.execute(f'SELECT {columns} FROM bindings') as cursor:
+            async for row in cursor:
+                yield row
 
     async def get_all_bindings(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('SELECT * FROM bindings') as cursor:
-                return await cursor.fetchall()
+        return [row async for row in self.iter_bindings()]
+
+    async def count_bindings(self) -> int:
+        """统计绑定用户数 (仅返回计数，不加载整张表)"""
+        db = await self._connection()
+        async with db.execute('SELECT COUNT(*) FROM bindings') as cursor:
+            return (await cursor.fetchone())[0]
 
-    def _Database__get_connection(self):
-        """提供内部连接方法供外部使用（用于 status 统计）"""
-        return aiosqlite.connect(self.db_path)
+    async def get_stats(self):
+        """单条语句同时统计绑定用户数与消息映射条数，返回 (user_count, sync_count)"""
+        db = await self._connection()
+        async with db.execute('''
+            SELECT (SELECT COUNT(*) FROM bindings), (SELECT COUNT(*) FROM message_mapping)
+        ''') as cursor:
+            return await cursor.fetchone()
 
     async def close(self):
-        """关闭数据库连接池（虽然 aiosqlite 是短连接，但预留接口以备未来扩展）"""
-        pass
+        """写完队列中剩余的消息映射后关闭共享连接"""
+        if self._mapping_writer is not None and not self._mapping_writer.done():
+            self._mapping_queue.put_nowait(None)
+            await self._mapping_writer
+        self._mapping_writer = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
 
 db = Database()
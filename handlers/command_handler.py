@@ -1,11 +1,10 @@
-from utils.version_utils import get_full_version_string
+from utils.version_utils import get_full_version_string, get_last_update_time
 from db.database import db
 from config.config_loader import config_loader
+import asyncio
 import logging
 import time
-import os
-import subprocess
-from datetime import datetime
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -20,14 +19,23 @@ HELP_TEXT = (
     "提示：绑定后，您在 Telegram 和 QQ 的消息将自动双向同步。"
 )
 
-async def handle_bind_command(qq_user_id: int, args: list):
+# QQ 号：5~11 位数字，不以 0 开头
+_QQ_NUMBER_RE = re.compile(r'[1-9]\d{4,10}')
+
+def parse_qq_number(args: list):
+    """从 /bind 指令参数中解析 QQ 号，格式不合法时返回 None"""
+    if not args:
+        return None
+    m = _QQ_NUMBER_RE.fullmatch(args[0])
+    return int(args[0]) if m else None
+
+def handle_bind_command(qq_user_id: int, args: list):
     """处理 /bind 指令"""
     if not args:
         return "Usage: /bind <qq_number>"
     
-    try:
-        qq_number = int(args[0])
-    except ValueError:
+    qq_number = parse_qq_number(args)
+    if qq_number is None:
         return "Error: QQ number must be an integer."
     
     # 在 QQ 端触发绑定时，我们通常不知道对方的 TG ID，除非他们先在 TG 端操作过
@@ -82,44 +90,29 @@ async def handle_setprefix_command(user_id: int, platform: str, args: list):
     return f"Your unified display name has been updated to: {new_prefix}"
 
 async def handle_status_command(start_time: float):
-    """处理 /status 指令，返回系统状态字符串"""
-    # 1. 获取最后更新时间
-    last_update = "Unknown"
-    try:
-        result = subprocess.run(['git', 'log', '-1', '--format=%ci'], 
-                                capture_output=True, text=True, check=True)
-        git_time_str = result.stdout.strip()
-        last_update = git_time_str.split('+')[0].strip()
-    except Exception:
-        try:
-            mtime = os.path.getmtime('main.py')
-            last_update = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
-        except:
-            pass
+    """处理 /status 指令，返回系统状态字符串 (start_time 为 time.monotonic() 时间戳)"""
+    # 1. 统计查询与 git 子进程互不依赖，并发执行 (git 调用放入线程池，避免阻塞事件循环)
+    loop = asyncio.get_running_loop()
+    last_update, version_str, (user_count, sync_count) = await asyncio.gather(
+        loop.run_in_executor(None, get_last_update_time),
+        loop.run_in_executor(None, get_full_version_string),
+        db.get_stats()
+    )
 
     # 2. 计算运行时长
-    uptime_seconds = int(time.time() - start_time)
+    uptime_seconds = int(time.monotonic() - start_time)
     hours, remainder = divmod(uptime_seconds, 3600)
     minutes, seconds = divmod(remainder, 60)
     uptime_str = f"{hours}小时 {minutes}分 {seconds}秒"
 
-    # 3. 获取同步统计 (通过 message_mapping 表行数近似)
-    async with db._Database__get_connection() as conn:
-        cursor = await conn.execute('SELECT COUNT(*) FROM message_mapping')
-        sync_count = (await cursor.fetchone())[0]
-
-    # 4. 获取绑定人数
-    bindings = await db.get_all_bindings()
-    user_count = len(bindings)
-
-    # 5. 获取配置信息
+    # 3. 获取配置信息
     qq_gid = config_loader.get('qq.group_id')
     tg_gid = config_loader.get('telegram.group_id')
 
     return (
         f"📊 TQSync 运行状态报告\n"
         f"--------------------------\n"
-        f"📦 版本信息: {get_full_version_string()}\n"
+        f"📦 版本信息: {version_str}\n"
         f"🕒 上次更新: {last_update}\n"
         f"⏱️ 运行时长: {uptime_str}\n"
         f"🔗 已同步消息: {sync_count} 条\n"
@@ -129,6 +122,6 @@ async def handle_status_command(start_time: float):
         f"--------------------------"
     )
 
-async def handle_help_command():
+def handle_help_command():
     """处理 /help 指令"""
     return HELP_TEXT
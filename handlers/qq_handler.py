@@ -1,35 +1,230 @@
 import aiohttp
+import asyncio
 import logging
+import random
+from typing import List, Optional
 from config.config_loader import config_loader
+from utils.json_utils import json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
+# 需要 Napcat 上传文件的消息段类型
+_MEDIA_SEGMENT_TYPES = frozenset(('image', 'video', 'file', 'record'))
+
+def _has_media_segment(message) -> bool:
+    return not isinstance(message, str) and any(seg.get('type') in _MEDIA_SEGMENT_TYPES for seg in message)
+
 class OneBotClient:
+    __slots__ = ('base_url', 'access_token', 'headers', '_send_url', '_delete_url', '_connector', 'session', '_send_queue', '_writer_task', 'max_retries')
+
+    # 单次从发送队列中取出的最大消息数
+    MAX_BATCH = 32
+    # 合并后纯文本消息的最大长度
+    MAX_MERGED_LENGTH = 4000
+    # 连接 Napcat 失败时的重试退避参数 (秒)
+    RETRY_BASE_DELAY = 0.5
+    RETRY_MAX_DELAY = 8.0
+    # 文本与普通 API 请求的超时：文本共用一个写协程，卡住的请求不能无限阻塞后续消息
+    API_TIMEOUT = aiohttp.ClientTimeout(total=60, sock_connect=10)
+    # 含图片/视频/文件的消息需等待 Napcat 完成上传，沿用 aiohttp 默认的 300 秒
+    MEDIA_TIMEOUT = aiohttp.ClientTimeout(total=300, sock_connect=10)
+
     def __init__(self):
         self.base_url = config_loader.get('qq.napcat_api_url')
         self.access_token = config_loader.get('qq.access_token')
         self.headers = {}
         if self.access_token:
             self.headers['Authorization'] = f'Bearer {self.access_token}'
+        self.max_retries = config_loader.get('qq.max_retries', 3)
+        # 预先拼接常用 API 地址
+        self._send_url = f"{self.base_url}/send_group_msg"
+        self._delete_url = f"{self.base_url}/delete_msg"
+        # 连接池与会话在首次请求时创建 (需要运行中的事件循环)
+        self._connector = None
+        self.session = None
+        # 发送队列与写协程同样在首次发送时创建
+        self._send_queue = None
+        self._writer_task = None
+
+    def _ensure_session(self):
+        """复用全局会话与连接池，避免每次请求重新握手"""
+        if self.session is None or self.session.closed:
+            # 禁用 SSL 验证以适配国内代理环境
+            self._connector = aiohttp.TCPConnector(
+                ssl=False,
+                limit=64,
+                limit_per_host=32,
+                keepalive_timeout=75,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=self._connector,
+                json_serialize=json_dumps,
+                timeout=self.API_TIMEOUT
+            )
+        return self.session
+
+    async def _call_api(self, url: str, payload: dict, timeout: aiohttp.ClientTimeout = None):
+        """调用 OneBot HTTP API，连接失败时按指数退避 (带抖动) 重试"""
+        delay = self.RETRY_BASE_DELAY
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._post(url, payload, timeout)
+            except aiohttp.ClientConnectorError as e:
+                # 仅重试建立连接失败的情况，请求未送达 Napcat，不会造成重复发送
+                if attempt >= self.max_retries:
+                    raise
+                wait = min(self.RETRY_MAX_DELAY, delay) * (0.8 + 0.4 * random.random())
+                logger.warning("连接 Napcat 失败，%.1f 秒后重试 (%d/%d): %s", wait, attempt + 1, self.max_retries, e)
+                await asyncio.sleep(wait)
+                delay *= 2
+
+    async def _post(self, url: str, payload: dict, timeout: aiohttp.ClientTimeout = None):
+        session = self._ensure_session()
+        async with session.post(url, json=payload, headers=self.headers, timeout=timeout or self.API_TIMEOUT) as resp:
+            # 使用快速解析器，且不校验 Content-Type (部分 Napcat 版本返回 text/plain)
+            result = await resp.json(loads=json_loads, content_type=None)
+            if result.get('retcode') != 0:
+                logger.error("OneBot API Error: %s", result)
+            return result
 
     async def send_group_msg(self, group_id: int, message):
         """
         发送群消息。支持字符串（CQ码）或列表（消息段数组）。
+        纯文本进入发送队列，由单个写协程合并后按序发送；
+        消息段数组 (图片/视频/文件等) 直接发送，慢速上传不会阻塞队列中的文本。
         """
-        url = f"{self.base_url}/send_group_msg"
+        if not isinstance(message, str):
+            return await self._send(group_id, message)
+        if self._send_queue is None:
+            self._send_queue = asyncio.Queue()
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+        fut = asyncio.get_running_loop().create_future()
+        self._send_queue.put_nowait((group_id, message, fut))
+        return await fut
+
+    async def _send(self, group_id: int, message):
         payload = {
             "group_id": group_id,
             "message": message,
             "auto_escape": False
         }
-        # 禁用 SSL 验证以适配国内代理环境
-        connector = aiohttp.TCPConnector(ssl=False)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.post(url, json=payload, headers=self.headers) as resp:
-                result = await resp.json()
-                if result.get('retcode') != 0:
-                    logger.error(f"OneBot API Error: {result}")
-                return result
+        timeout = self.MEDIA_TIMEOUT if _has_media_segment(message) else None
+        return await self._call_api(self._send_url, payload, timeout)
+
+    def _coalesce(self, batch: list):
+        """将发往同一群组的相邻纯文本消息合并为一条，返回 [(group_id, message, [futures])]"""
+        merged = []
+        for group_id, message, fut in batch:
+            if merged and isinstance(message, str):
+                last_group_id, last_message, futures = merged[-1]
+                if (last_group_id == group_id and isinstance(last_message, str)
+                        and len(last_message) + len(message) < self.MAX_MERGED_LENGTH):
+                    merged[-1] = (group_id, f"{last_message}\n{message}", futures + [fut])
+                    continue
+            merged.append((group_id, message, [fut]))
+        return merged
+
+    async def _writer_loop(self):
+        """发送队列的消费者：批量取出消息，合并纯文本后逐条调用 API"""
+        while True:
+            batch = [await self._send_queue.get()]
+            while len(batch) < self.MAX_BATCH and not self._send_queue.empty():
+                batch.append(self._send_queue.get_nowait())
+
+            for group_id, message, futures in self._coalesce(batch):
+                try:
+                    result = await self._send(group_id, message)
+                except Exception as e:
+                    for fut in futures:
+                        if not fut.done():
+                            fut.set_exception(e)
+                else:
+                    for fut in futures:
+                        if not fut.done():
+                            fut.set_result(result)
+
+    async def delete_msg(self, message_id: int):
+        """撤回消息"""
+        return await self._call_api(self._delete_url, {"message_id": message_id})
+
+    async def close(self):
+        """停止发送协程并关闭会话与连接池"""
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        self._connector = None
+
+def get_message_id(result) -> Optional[int]:
+    """从 OneBot API 响应中取出 message_id，失败响应 (data 为 null) 返回 None"""
+    data = result.get('data') if result else None
+    return data.get('message_id') if data else None
+
+class ParsedMessage:
+    """OneBot v11 消息段数组的单次遍历解析结果 (每条消息创建一次，使用 __slots__ 省去实例字典)"""
+    __slots__ = ('text_parts', 'at_qq_ids', 'image_url', 'video_url', 'file_url', 'file_name', 'reply_msg_id')
+
+    def __init__(self):
+        self.text_parts: List[str] = []
+        self.at_qq_ids: List[int] = []
+        self.image_url: Optional[str] = None
+        self.video_url: Optional[str] = None
+        self.file_url: Optional[str] = None
+        self.file_name: str = "unknown_file"
+        self.reply_msg_id: Optional[int] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.text_parts).strip()
+
+def _seg_text(parsed: ParsedMessage, data: dict):
+    parsed.text_parts.append(data.get('text', ''))
+
+def _seg_at(parsed: ParsedMessage, data: dict):
+    target_qq = int(data.get('qq', 0))
+    if target_qq != 0: # 排除 @全体成员
+        parsed.at_qq_ids.append(target_qq)
+
+def _seg_image(parsed: ParsedMessage, data: dict):
+    if not parsed.image_url:
+        parsed.image_url = data.get('url') or data.get('file')
+
+def _seg_video(parsed: ParsedMessage, data: dict):
+    if not parsed.video_url:
+        parsed.video_url = data.get('url') or data.get('file')
+
+def _seg_file(parsed: ParsedMessage, data: dict):
+    if not parsed.file_url:
+        parsed.file_url = data.get('url') or data.get('file')
+        parsed.file_name = data.get('name', 'unknown_file')
+
+def _seg_reply(parsed: ParsedMessage, data: dict):
+    if parsed.reply_msg_id is None:
+        parsed.reply_msg_id = int(data.get('id', 0)) or None
+
+# 消息段类型 -> 处理函数
+_SEGMENT_HANDLERS = {
+    'text': _seg_text,
+    'at': _seg_at,
+    'image': _seg_image,
+    'video': _seg_video,
+    'file': _seg_file,
+    'reply': _seg_reply,
+}
+
+def parse_message_segments(message_array: list) -> ParsedMessage:
+    """单次遍历消息段数组，提取文本、@、回复与媒体信息"""
+    parsed = ParsedMessage()
+    for msg_part in message_array:
+        handler = _SEGMENT_HANDLERS.get(msg_part.get('type'))
+        if handler:
+            handler(parsed, msg_part.get('data') or {})
+    return parsed
 
 # 全局实例
 onebot_client = OneBotClient()
@@ -3,16 +3,34 @@ from telegram.ext import ContextTypes, MessageHandler, filters, CommandHandler
 from config.config_loader import config_loader
 from core.sync_engine import SyncEngine
 from db.database import db
-from handlers.qq_handler import onebot_client
-from handlers.command_handler import handle_setprefix_command as handle_setprefix_command_logic, handle_help_command as handle_help_command_logic, handle_status_command
+from handlers.qq_handler import onebot_client, get_message_id
+from handlers.command_handler import handle_setprefix_command as handle_setprefix_command_logic, handle_help_command as handle_help_command_logic, handle_status_command, parse_qq_number
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
+def tg_sender_name(user) -> str:
+    """Telegram 用户的回退显示名：优先用户名，没有用户名时使用 ID"""
+    return user.username or str(user.id)
+
+# (消息属性, 转发函数, 日志名称, 转发参数提取函数)，按优先级排列 (视频优先于 document 判断)
+_TG_MEDIA_TYPES = (
+    ('photo', SyncEngine.forward_image_to_qq, '图片', lambda m: (m.photo[-1].file_id, m.caption or "")),
+    ('video', SyncEngine.forward_video_to_qq, '视频', lambda m: (m.video.file_id,)),
+    ('document', SyncEngine.forward_file_to_qq, '文件', lambda m: (m.document.file_id, m.document.file_name or "unknown_file")),
+)
+
+def extract_tg_media(msg):
+    """单次遍历识别媒体类型，返回 (转发函数, 日志名称, 转发参数)，非媒体消息返回 None"""
+    for attr, forward_func, label, extract in _TG_MEDIA_TYPES:
+        if getattr(msg, attr):
+            return forward_func, label, extract(msg)
+    return None
+
 async def handle_message_deleted(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """处理 Telegram 消息删除事件，同步撤回到 QQ"""
-    logger.info(f"收到 Telegram 删除消息事件: {update}")
+    logger.debug("收到 Telegram 删除消息事件: %s", update)
     
     # PTB v21+ 中，deleted_message_ids 位于 update.channel_post 或 update.message 之外，直接在 update 对象上
     deleted_ids = getattr(update, 'deleted_message_ids', [])
@@ -22,39 +40,40 @@ async def handle_message_deleted(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     # 检查聊天 ID (优先使用 effective_chat)
-    chat_id = None
-    if update.effective_chat:
-        chat_id = update.effective_chat.id
-    elif hasattr(update, 'chat'):
-        chat_id = update.chat.id
+    chat = update.effective_chat or getattr(update, 'chat', None)
+    chat_id = chat.id if chat else None
     
-    if chat_id != config_loader.get('telegram.group_id'):
-        logger.warning(f"群组 ID 不匹配: {chat_id} vs {config_loader.get('telegram.group_id')}")
+    engine = SyncEngine.get_instance()
+    if chat_id != engine.tg_group_id:
+        logger.warning("群组 ID 不匹配: %s vs %s", chat_id, engine.tg_group_id)
         return
     
+    # 撤回成功的映射在循环结束后一次性删除
+    recalled = []
     for msg_id in deleted_ids:
-        logger.info(f"正在处理 TG 消息撤回 (ID: {msg_id})")
+        logger.info("正在处理 TG 消息撤回 (ID: %s)", msg_id)
         qq_msg_id = await db.get_qq_msg_id_by_tg(msg_id)
         if qq_msg_id:
             try:
                 await onebot_client.delete_msg(qq_msg_id)
-                logger.info(f"已同步撤回：TG (ID: {msg_id}) -> QQ (ID: {qq_msg_id})")
-                await db.delete_mapping_by_tg(msg_id)
+                logger.info("已同步撤回：TG (ID: %s) -> QQ (ID: %s)", msg_id, qq_msg_id)
+                recalled.append(msg_id)
             except Exception as e:
-                logger.error(f"在 QQ 端执行撤回失败: {e}")
+                logger.error("在 QQ 端执行撤回失败: %s", e)
         else:
-            logger.warning(f"未找到 TG 消息 ID {msg_id} 对应的 QQ 映射记录")
+            logger.warning("未找到 TG 消息 ID %s 对应的 QQ 映射记录", msg_id)
+    await db.delete_mappings_by_tg(recalled)
 
 async def handle_tg_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.effective_chat or update.effective_chat.id != config_loader.get('telegram.group_id'):
-        return
-    
-    user = update.effective_user
+    # 非目标群组的消息已由 get_tg_handlers 中的 filters.Chat 在分发阶段过滤
     engine = SyncEngine.get_instance()
+    user = update.effective_user
+    sender_name = tg_sender_name(user)
     msg = update.message
     
     # 诊断日志：打印媒体类型
-    logger.debug(f"收到 TG 消息 - 图片: {bool(msg.photo)}, 视频: {bool(msg.video)}, 文件: {bool(msg.document)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("收到 TG 消息 - 图片: %s, 视频: %s, 文件: %s", bool(msg.photo), bool(msg.video), bool(msg.document))
 
     # 解析回复逻辑 (TG -> QQ)
     reply_segment = []
@@ -63,58 +82,24 @@ async def handle_tg_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         original_qq_id = await db.get_qq_msg_id_by_tg(original_tg_id)
         if original_qq_id:
             reply_segment.append({"type": "reply", "data": {"id": str(original_qq_id)}})
-            logger.info(f"检测到 TG 回复，映射到 QQ 消息 ID: {original_qq_id}")
+            logger.info("检测到 TG 回复，映射到 QQ 消息 ID: %s", original_qq_id)
 
-    # 处理图片消息
-    if msg.photo:
-        file_id = msg.photo[-1].file_id
-        caption = msg.caption or ""
+    # 处理媒体消息 (图片 / 视频 / 通用文件)
+    media = extract_tg_media(msg)
+    if media:
+        forward_func, label, args = media
+        logger.info("检测到来自 %s 的%s，正在转发至 QQ...", sender_name, label)
         try:
-            result = await engine.forward_image_to_qq(user.id, user.username or str(user.id), file_id, caption)
-            if result and result.get('data', {}).get('message_id'):
-                qq_msg_id = result['data']['message_id']
-                await db.save_message_mapping(
+            result = await forward_func(engine, user.id, sender_name, *args)
+            qq_msg_id = get_message_id(result)
+            if qq_msg_id:
+                db.save_message_mapping(
                     tg_message_id=update.message.message_id,
                     qq_message_id=qq_msg_id,
                     sender_tg_id=user.id
                 )
-                # 如果是回复消息，需要更新被回复消息的映射（如果需要更复杂的引用链）
-        except Exception as e:
-            logger.error(f"同步图片至 QQ 失败: {e}")
-            await update.message.reply_text(f"❌ 同步到 QQ 失败: {str(e)[:50]}")
-        return
-
-    # 处理视频消息 (优先于 document 判断)
-    if msg.video:
-        file_id = msg.video.file_id
-        logger.info(f"检测到来自 {user.username} 的视频，正在转发至 QQ...")
-        try:
-            result = await engine.forward_video_to_qq(user.id, user.username or str(user.id), file_id)
-            if result and result.get('data', {}).get('message_id'):
-                await db.save_message_mapping(
-                    tg_message_id=update.message.message_id,
-                    qq_message_id=result['data']['message_id'],
-                    sender_tg_id=user.id
-                )
         except Exception as e:
-            logger.error(f"同步视频至 QQ 失败: {e}")
-            await update.message.reply_text(f"❌ 同步到 QQ 失败: {str(e)[:50]}")
-        return
-
-    # 处理通用文件
-    if msg.document:
-        file_id = msg.document.file_id
-        filename = msg.document.file_name or "unknown_file"
-        try:
-            result = await engine.forward_file_to_qq(user.id, user.username or str(user.id), file_id, filename)
-            if result and result.get('data', {}).get('message_id'):
-                await db.save_message_mapping(
-                    tg_message_id=update.message.message_id,
-                    qq_message_id=result['data']['message_id'],
-                    sender_tg_id=user.id
-                )
-        except Exception as e:
-            logger.error(f"同步文件至 QQ 失败: {e}")
+            logger.error("同步%s至 QQ 失败: %s", label, e)
             await update.message.reply_text(f"❌ 同步到 QQ 失败: {str(e)[:50]}")
         return
 
@@ -141,13 +126,11 @@ async def handle_tg_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         # 简单处理：这里需要根据 mention 的名字去查 TG ID，比较复杂，先简化为纯文本
                         pass 
 
-                    if target_tg_id:
-                        binding = await db.get_binding_by_tg(target_tg_id)
-                        if binding:
-                            message_array.append({"type": "at", "data": {"qq": binding[1]}})
-                        else:
-                            message_array.append({"type": "text", "data": {"text": text[entity.offset:entity.offset+entity.length]}})
+                    binding = await db.get_binding_by_tg(target_tg_id) if target_tg_id else None
+                    if binding:
+                        message_array.append({"type": "at", "data": {"qq": binding[1]}})
                     else:
+                        # 无法映射到 QQ 用户时保留原始文本
                         message_array.append({"type": "text", "data": {"text": text[entity.offset:entity.offset+entity.length]}})
                     
                     last_offset = entity.offset + entity.length
@@ -159,17 +142,18 @@ async def handle_tg_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if not message_array:
                 message_array.append({"type": "text", "data": {"text": text}})
 
-            display_name = await engine.get_display_name(tg_user_id=user.id, fallback_name=user.username or str(user.id))
+            display_name = await engine.get_display_name(tg_user_id=user.id, fallback_name=sender_name)
             
             # 构造最终消息数组：回复段 + 前缀 + 内容
             final_message = reply_segment + [{"type": "text", "data": {"text": f"[TG] {display_name}: "}}] + message_array
             
             result = await onebot_client.send_group_msg(engine.qq_group_id, final_message)
             # 存储映射关系（如果是纯文本）
-            if result and result.get('data', {}).get('message_id'):
-                await db.save_message_mapping(
+            qq_msg_id = get_message_id(result)
+            if qq_msg_id:
+                db.save_message_mapping(
                     tg_message_id=update.message.message_id,
-                    qq_message_id=result['data']['message_id'],
+                    qq_message_id=qq_msg_id,
                     sender_tg_id=user.id
                 )
         except RuntimeError as e:
@@ -185,12 +169,8 @@ async def handle_setprefix_command(update: Update, context: ContextTypes.DEFAULT
     await update.message.reply_text(response)
 
 async def handle_status_command_tg(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from main import start_time
-    # 增加合理性检查，防止显示异常时长
-    if start_time < 1704067200: 
-        response = "系统时间记录异常，请尝试重启机器人。"
-    else:
-        response = await handle_status_command(start_time)
+    from main import GLOBAL_START_TIME
+    response = await handle_status_command(GLOBAL_START_TIME)
     await update.message.reply_text(response)
 
 async def handle_reboot_command_tg(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -205,10 +185,10 @@ async def handle_reboot_command_tg(update: Update, context: ContextTypes.DEFAULT
         return
         
     await update.message.reply_text("🔄 正在执行优雅重启，服务将在数秒后恢复...")
-    asyncio.create_task(graceful_restart())
+    graceful_restart()
 
 async def handle_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    response = await handle_help_command_logic()
+    response = handle_help_command_logic()
     await update.message.reply_text(response)
 
 async def handle_bind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -216,7 +196,10 @@ async def handle_bind_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("Usage: /bind <qq_number>")
         return
     
-    qq_number = int(context.args[0])
+    qq_number = parse_qq_number(context.args)
+    if qq_number is None:
+        await update.message.reply_text("Error: QQ number must be an integer.")
+        return
     tg_user = update.effective_user
     
     # 简单绑定逻辑：直接建立映射
@@ -224,9 +207,12 @@ async def handle_bind_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.message.reply_text(f"Successfully bound to QQ: {qq_number}")
 
 def get_tg_handlers():
+    # 仅同步目标群组的消息，在 PTB 分发阶段过滤，不为其他聊天创建处理任务
+    target_chat = filters.Chat(chat_id=int(config_loader.get('telegram.group_id')))
     return [
-        # 使用 filters.ALL 接收所有消息，然后在 handle_tg_message 内部进行类型判断
-        MessageHandler(filters.ALL & ~filters.COMMAND, handle_tg_message),
+        # 接收目标群组的所有非命令消息，然后在 handle_tg_message 内部进行类型判断
+        MessageHandler(filters.ALL & ~filters.COMMAND & target_chat, handle_tg_message),
+        # 命令不限制聊天，允许私聊机器人执行 /bind 等操作
         CommandHandler('bind', handle_bind_command),
         CommandHandler('setprefix', handle_setprefix_command),
         CommandHandler('help', handle_help_command),
@@ -10,13 +10,13 @@ def print_banner():
 
 def check_python():
     print("\n[1/4] 检查 Python 环境...")
-    try:
-        version = subprocess.check_output(["python", "--version"], stderr=subprocess.STDOUT).decode().strip()
-        print(f"检测到: {version}")
-        return True
-    except Exception:
-        print("错误: 未检测到 Python。请确保已安装 Python 3.9+ 并添加到系统 PATH。")
+    # 直接读取当前解释器版本，无需再启动一个 python 子进程
+    version = ".".join(str(v) for v in sys.version_info[:3])
+    print(f"检测到: Python {version}")
+    if sys.version_info < (3, 9):
+        print("错误: Python 版本过低。请安装 Python 3.9+ 并添加到系统 PATH。")
         return False
+    return True
 
 def install_dependencies():
     print("\n[2/4] 安装项目依赖...")
@@ -30,23 +30,26 @@ def install_dependencies():
 
 def setup_config():
     print("\n[3/4] 检查配置文件...")
-    if not os.path.exists("config.yaml"):
-        if os.path.exists("config.yaml.example"):
-            shutil.copy("config.yaml.example", "config.yaml")
-            print("已从模板创建 config.yaml，请务必打开并填入你的 Token 和群组 ID！")
-        else:
-            print("警告: 未找到 config.yaml.example 模板文件。")
-    else:
+    if os.path.exists("config.yaml"):
         print("config.yaml 已存在。")
+        return True
+    # 直接复制，模板不存在时由异常告知，无需先检查
+    try:
+        shutil.copy("config.yaml.example", "config.yaml")
+        print("已从模板创建 config.yaml，请务必打开并填入你的 Token 和群组 ID！")
+    except FileNotFoundError:
+        print("警告: 未找到 config.yaml.example 模板文件。")
     return True
 
 def create_directories():
     print("\n[4/4] 检查必要目录...")
     dirs = ["db", "logs"]
     for d in dirs:
-        if not os.path.exists(d):
+        try:
             os.makedirs(d)
             print(f"创建目录: {d}")
+        except FileExistsError:
+            pass
     print("目录检查完成。")
     return True
 
@@ -1,9 +1,13 @@
 import asyncio
+import contextlib
+import html
 import logging
 import os
+import signal
+import sys
 import time
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, BaseHandler, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram.request import HTTPXRequest
 from aiohttp import web
 import uvicorn
@@ -11,10 +15,11 @@ import uvicorn
 from config.config_loader import config_loader
 from db.database import db
 from core.sync_engine import SyncEngine
-from handlers.tg_handler import get_tg_handlers
+from handlers.tg_handler import get_tg_handlers, handle_message_deleted
 from handlers.command_handler import handle_bind_command, handle_setprefix_command, handle_help_command, handle_status_command
-from handlers.qq_handler import onebot_client
+from handlers.qq_handler import onebot_client, parse_message_segments
 from api.admin_api import app as admin_app
+from utils.json_utils import json_loads
 
 logging.basicConfig(
     format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
@@ -22,176 +27,219 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 记录全局启动时间，用于 Web 面板显示运行时长
-GLOBAL_START_TIME = time.time()
+# 记录全局启动时间 (单调时钟，不受系统时间调整影响)，用于计算运行时长
+GLOBAL_START_TIME = time.monotonic()
+
+# 同步引擎实例，在 main() 中初始化一次
+engine = None
+
+async def handle_group_recall(data: dict):
+    """处理 QQ 群消息撤回通知，同步撤回到 TG"""
+    # 其他群组的撤回无需查询映射
+    if data.get('group_id') != engine.qq_group_id:
+        return
+    qq_msg_id = data.get('message_id')
+    if qq_msg_id:
+        tg_msg_id = await db.get_tg_msg_id_by_qq(qq_msg_id)
+        if tg_msg_id:
+            try:
+                await engine.bot.delete_message(chat_id=engine.tg_group_id, message_id=tg_msg_id)
+                logger.info("Synced recall from QQ (msg_id: %s) to TG (msg_id: %s)", qq_msg_id, tg_msg_id)
+            except Exception as e:
+                logger.error("Failed to delete message in TG: %s", e)
+
+async def handle_notice_event(data: dict):
+    handler = NOTICE_DISPATCH.get(data.get('notice_type'))
+    if handler:
+        await handler(data)
+
+async def handle_message_event(data: dict):
+    # 仅处理群消息
+    if data.get('message_type') == 'group':
+        await handle_group_message(data)
+
+async def handle_group_message(data: dict):
+    """处理目标 QQ 群的消息：指令路由或同步到 TG"""
+    # [新增] 校验群组 ID，防止同步非目标群组的消息
+    if data.get('group_id') != engine.qq_group_id:
+        logger.debug("忽略非目标群组消息: %s", data.get('group_id'))
+        return
+    
+    sender = data.get('sender', {})
+    qq_id = data['user_id']
+    nickname = sender.get('card') or sender.get('nickname') or str(qq_id)
+    
+    # 处理消息段数组 (OneBot v11)，单次遍历完成解析
+    message_array = data.get('message', [])
+    parsed = parse_message_segments(message_array)
+    image_url = parsed.image_url
+    video_url = parsed.video_url
+    file_url = parsed.file_url
+    file_name = parsed.file_name
+    
+    at_tg_ids = []
+    for target_qq in parsed.at_qq_ids:
+        binding = await db.get_binding_by_qq(target_qq)
+        if binding:
+            at_tg_ids.append(binding[0]) # tg_user_id
+    
+    combined_text = parsed.text
+    
+    # 指令识别与路由
+    if combined_text.startswith('/'):
+        # 只切出指令名，参数仅在指令存在时再拆分
+        parts = combined_text.split(None, 1)
+        cmd = parts[0].lower()
+        
+        command = QQ_COMMAND_DISPATCH.get(cmd)
+        if command:
+            args = parts[1].split() if len(parts) > 1 else []
+            response = await command(qq_id, args)
+        else:
+            response = "Unknown command. Use /help for more info."
+        
+        if response:
+            await onebot_client.send_group_msg(engine.qq_group_id, response)
+        return
+
+    # 解析回复逻辑 (QQ -> TG)
+    reply_to_tg_id = None
+    if parsed.reply_msg_id:
+        reply_to_tg_id = await db.get_tg_msg_id_by_qq(parsed.reply_msg_id)
+        if reply_to_tg_id:
+            logger.info("检测到 QQ 回复，映射到 TG 消息 ID: %s", reply_to_tg_id)
+    
+    # 媒体消息交由后台队列处理
+    if not at_tg_ids:
+        # (转发函数, 媒体地址, 附带文字/文件名)，按图片、视频、文件的优先级取第一个
+        if image_url:
+            media = (engine.forward_image_to_tg, image_url, combined_text)
+        elif video_url:
+            media = (engine.forward_video_to_tg, video_url, combined_text)
+        elif file_url:
+            media = (engine.forward_file_to_tg, file_url, file_name)
+        else:
+            media = None
+        if media:
+            forward_func, url, extra = media
+            await enqueue_media_task(data, forward_func, qq_id, nickname, url, extra, reply_to_message_id=reply_to_tg_id)
+            return
+        if not combined_text:
+            return
+    
+    try:
+        if at_tg_ids:
+            # 构造 TG 的 HTML 消息以支持 @
+            display_name = await engine.get_display_name(qq_user_id=qq_id, fallback_name=nickname)
+            # 昵称与正文需转义，避免其中的 < > & 破坏 HTML 解析导致发送失败
+            mentions = "".join(f"<a href='tg://user?id={tid}'>@User</a> " for tid in at_tg_ids)
+            html_text = f"[QQ] <b>{html.escape(display_name)}</b>: {mentions}{html.escape(combined_text)}"
+            result = await engine.bot.send_message(chat_id=engine.tg_group_id, text=html_text, parse_mode='HTML', reply_to_message_id=reply_to_tg_id)
+        else:
+            result = await engine.forward_to_tg(qq_id, nickname, combined_text, reply_to_message_id=reply_to_tg_id)
+        
+        if result:
+            db.save_message_mapping(
+                tg_message_id=result.message_id,
+                qq_message_id=data.get('message_id'),
+                sender_qq_id=qq_id
+            )
+    except Exception as e:
+        logger.error("同步消息至 Telegram 失败: %s", e)
+        await report_sync_failure(data, e)
+
+async def qq_cmd_bind(qq_id: int, args: list):
+    return handle_bind_command(qq_id, args)
+
+async def qq_cmd_setprefix(qq_id: int, args: list):
+    return await handle_setprefix_command(qq_id, 'qq', args)
+
+async def qq_cmd_help(qq_id: int, args: list):
+    return handle_help_command()
+
+async def qq_cmd_status(qq_id: int, args: list):
+    return await handle_status_command(GLOBAL_START_TIME)
+
+async def qq_cmd_reboot(qq_id: int, args: list):
+    admin_ids = config_loader.get('server.admin_user_ids', [])
+    if admin_ids and qq_id not in admin_ids:
+        return "⛔ 权限不足：仅管理员可执行重启操作"
+    
+    await onebot_client.send_group_msg(engine.qq_group_id, "🔄 正在执行优雅重启，服务将在数秒后恢复...")
+    graceful_restart()
+
+# QQ 指令 -> 处理函数 (qq_id, args)，返回需回复的文本
+QQ_COMMAND_DISPATCH = {
+    '/bind': qq_cmd_bind,
+    '/setprefix': qq_cmd_setprefix,
+    '/help': qq_cmd_help,
+    '/status': qq_cmd_status,
+    '/reboot': qq_cmd_reboot,
+}
+
+async def report_sync_failure(data: dict, error: Exception):
+    """在 QQ 群中回复原消息，提示同步到 Telegram 失败"""
+    error_msg = [{"type": "text", "data": {"text": f"❌ 同步到 Telegram 失败: {str(error)[:30]}"}}, 
+                 {"type": "reply", "data": {"id": str(data.get('message_id'))}}]
+    await onebot_client.send_group_msg(engine.qq_group_id, error_msg)
+
+# 媒体转发队列：下载/上传耗时较长，交由后台协程处理，避免阻塞后续文本消息
+MEDIA_QUEUE_SIZE = 32
+media_queue = None
+
+async def enqueue_media_task(data: dict, forward_func, *args, **kwargs):
+    """将媒体转发任务放入有界队列，队列已满时等待空位 (背压)，不丢弃任何媒体"""
+    await media_queue.put((data, forward_func, args, kwargs))
+
+async def process_media_queue():
+    """媒体转发队列的消费者"""
+    while True:
+        data, forward_func, args, kwargs = await media_queue.get()
+        try:
+            await forward_func(*args, **kwargs)
+        except Exception as e:
+            logger.error("同步媒体至 Telegram 失败: %s", e)
+            await report_sync_failure(data, e)
+
+# notice_type -> 处理函数
+NOTICE_DISPATCH = {
+    'group_recall': handle_group_recall,
+}
+
+# post_type -> 处理函数
+POST_TYPE_DISPATCH = {
+    'message': handle_message_event,
+    'notice': handle_notice_event,
+}
+
+# 事件队列：群消息与通知分开排队、各自由独立协程处理，通知风暴不会拖慢群消息
+message_queue = None
+notice_queue = None
+
+async def process_event_queue(queue: asyncio.Queue):
+    """事件队列的消费者"""
+    while True:
+        handler, data = await queue.get()
+        try:
+            await handler(data)
+        except Exception as e:
+            logger.error("Event handler error: %s", e)
 
 async def handle_qq_webhook(request):
     try:
-        data = await request.json()
+        # 直接解析原始 bytes，跳过 str 解码
+        data = json_loads(await request.read())
         
-        # 处理撤回通知 (Notice)
-        if data.get('post_type') == 'notice' and data.get('notice_type') == 'group_recall':
-            qq_msg_id = data.get('message_id')
-            if qq_msg_id:
-                tg_msg_id = await db.get_tg_msg_id_by_qq(qq_msg_id)
-                if tg_msg_id:
-                    engine = SyncEngine.get_instance()
-                    try:
-                        await engine.bot.delete_message(chat_id=engine.tg_group_id, message_id=tg_msg_id)
-                        logger.info(f"Synced recall from QQ (msg_id: {qq_msg_id}) to TG (msg_id: {tg_msg_id})")
-                    except Exception as e:
-                        logger.error(f"Failed to delete message in TG: {e}")
-            return web.Response(text="ok")
-
-        # 仅处理群消息
-        if data.get('message_type') == 'group':
-            # [新增] 校验群组 ID，防止同步非目标群组的消息
-            target_group_id = config_loader.get('qq.group_id')
-            if data.get('group_id') != target_group_id:
-                logger.debug(f"忽略非目标群组消息: {data.get('group_id')}")
-                return web.Response(text="ok")
-            
-            sender = data.get('sender', {})
-            qq_id = data['user_id']
-            nickname = sender.get('card') or sender.get('nickname') or str(qq_id)
-            
-            engine = SyncEngine.get_instance()
-            
-            # 处理消息段数组 (OneBot v11)
-            message_array = data.get('message', [])
-            text_parts = []
-            image_url = None
-            video_url = None
-            file_url = None
-            file_name = "unknown_file"
-            at_tg_ids = []
-            
-            for msg_part in message_array:
-                msg_type = msg_part.get('type')
-                if msg_type == 'text':
-                    text_parts.append(msg_part['data'].get('text', ''))
-                elif msg_type == 'at':
-                    target_qq = int(msg_part['data'].get('qq', 0))
-                    if target_qq != 0: # 排除 @全体成员
-                        binding = await db.get_binding_by_qq(target_qq)
-                        if binding:
-                            at_tg_ids.append(binding[0]) # tg_user_id
-                elif msg_type == 'image' and not image_url:
-                    image_url = msg_part['data'].get('url') or msg_part['data'].get('file')
-                elif msg_type == 'video' and not video_url:
-                    video_url = msg_part['data'].get('url') or msg_part['data'].get('file')
-                elif msg_type == 'file' and not file_url:
-                    file_url = msg_part['data'].get('url') or msg_part['data'].get('file')
-                    file_name = msg_part['data'].get('name', 'unknown_file')
-            
-            combined_text = "".join(text_parts).strip()
-            
-            # 指令识别与路由
-            if combined_text.startswith('/'):
-                parts = combined_text.split()
-                cmd = parts[0].lower()
-                args = parts[1:]
-                response = ""
-                
-                if cmd == '/bind':
-                    response = await handle_bind_command(qq_id, args)
-                elif cmd == '/setprefix':
-                    response = await handle_setprefix_command(qq_id, 'qq', args)
-                elif cmd == '/help':
-                    response = await handle_help_command()
-                elif cmd == '/status':
-                    response = await handle_status_command(start_time)
-                elif cmd == '/reboot':
-                    admin_ids = config_loader.get('server.admin_user_ids', [])
-                    if admin_ids and qq_id not in admin_ids:
-                        await onebot_client.send_group_msg(engine.qq_group_id, "⛔ 权限不足：仅管理员可执行重启操作")
-                        return web.Response(text="ok")
-                    
-                    await onebot_client.send_group_msg(engine.qq_group_id, "🔄 正在执行优雅重启，服务将在数秒后恢复...")
-                    asyncio.create_task(graceful_restart())
-                    return web.Response(text="ok")
-                else:
-                    response = "Unknown command. Use /help for more info."
-                
-                if response:
-                    await onebot_client.send_group_msg(engine.qq_group_id, response)
-                return web.Response(text="ok")
-
-            # 解析回复逻辑 (QQ -> TG)
-            reply_to_tg_id = None
-            for msg_part in message_array:
-                if msg_part.get('type') == 'reply':
-                    original_qq_id = int(msg_part['data'].get('id', 0))
-                    if original_qq_id:
-                        reply_to_tg_id = await db.get_tg_msg_id_by_qq(original_qq_id)
-                        if reply_to_tg_id:
-                            logger.info(f"检测到 QQ 回复，映射到 TG 消息 ID: {reply_to_tg_id}")
-                        break
-            
-            combined_text = "".join(text_parts).strip()
-            
-            # 构造 TG 的 HTML 消息以支持 @
-            if at_tg_ids:
-                display_name = await engine.get_display_name(qq_user_id=qq_id, fallback_name=nickname)
-                html_text = f"[QQ] <b>{display_name}</b>: "
-                for tid in at_tg_ids:
-                    html_text += f"<a href='tg://user?id={tid}'>@User</a> "
-                html_text += combined_text
-                try:
-                    result = await engine.bot.send_message(chat_id=engine.tg_group_id, text=html_text, parse_mode='HTML', reply_to_message_id=reply_to_tg_id)
-                    if result:
-                        await db.save_message_mapping(
-                            tg_message_id=result.message_id,
-                            qq_message_id=data.get('message_id'),
-                            sender_qq_id=qq_id
-                        )
-                except Exception as e:
-                    logger.error(f"发送 HTML 消息至 Telegram 失败: {e}")
-                    error_msg = [{"type": "text", "data": {"text": f"❌ 同步到 Telegram 失败: {str(e)[:30]}"}}, 
-                                 {"type": "reply", "data": {"id": str(data.get('message_id'))}}]
-                    await onebot_client.send_group_msg(engine.qq_group_id, error_msg)
-            elif image_url:
-                try:
-                    await engine.forward_image_to_tg(qq_id, nickname, image_url, combined_text, reply_to_message_id=reply_to_tg_id)
-                except Exception as e:
-                    logger.error(f"同步图片至 Telegram 失败: {e}")
-                    error_msg = [{"type": "text", "data": {"text": f"❌ 同步到 Telegram 失败: {str(e)[:30]}"}}, 
-                                 {"type": "reply", "data": {"id": str(data.get('message_id'))}}]
-                    await onebot_client.send_group_msg(engine.qq_group_id, error_msg)
-            elif video_url:
-                try:
-                    await engine.forward_video_to_tg(qq_id, nickname, video_url, combined_text, reply_to_message_id=reply_to_tg_id)
-                except Exception as e:
-                    logger.error(f"同步视频至 Telegram 失败: {e}")
-                    error_msg = [{"type": "text", "data": {"text": f"❌ 同步到 Telegram 失败: {str(e)[:30]}"}}, 
-                                 {"type": "reply", "data": {"id": str(data.get('message_id'))}}]
-                    await onebot_client.send_group_msg(engine.qq_group_id, error_msg)
-            elif file_url:
-                try:
-                    await engine.forward_file_to_tg(qq_id, nickname, file_url, file_name, reply_to_message_id=reply_to_tg_id)
-                except Exception as e:
-                    logger.error(f"同步文件至 Telegram 失败: {e}")
-                    error_msg = [{"type": "text", "data": {"text": f"❌ 同步到 Telegram 失败: {str(e)[:30]}"}}, 
-                                 {"type": "reply", "data": {"id": str(data.get('message_id'))}}]
-                    await onebot_client.send_group_msg(engine.qq_group_id, error_msg)
-            elif combined_text:
-                try:
-                    result = await engine.forward_to_tg(qq_id, nickname, combined_text, reply_to_message_id=reply_to_tg_id)
-                    if result:
-                        await db.save_message_mapping(
-                            tg_message_id=result.message_id,
-                            qq_message_id=data.get('message_id'),
-                            sender_qq_id=qq_id
-                        )
-                except Exception as e:
-                    logger.error(f"同步文本至 Telegram 失败: {e}")
-                    error_msg = [{"type": "text", "data": {"text": f"❌ 同步到 Telegram 失败: {str(e)[:30]}"}}, 
-                                 {"type": "reply", "data": {"id": str(data.get('message_id'))}}]
-                    await onebot_client.send_group_msg(engine.qq_group_id, error_msg)
+        # 仅做路由，不在请求内执行处理逻辑
+        post_type = data.get('post_type')
+        handler = POST_TYPE_DISPATCH.get(post_type)
+        if handler:
+            queue = message_queue if post_type == 'message' else notice_queue
+            queue.put_nowait((handler, data))
         
         return web.Response(text="ok")
     except Exception as e:
-        logger.error(f"Webhook error: {e}")
+        logger.error("Webhook error: %s", e)
         return web.Response(text="error", status=500)
 
 async def start_qq_webhook():
@@ -205,45 +253,111 @@ async def start_qq_webhook():
     logger.info(f"QQ Webhook server started on port {config_loader.get('server.qq_webhook_port')}")
     await site.start()
     
-    # 保持运行
-    while True:
-        await asyncio.sleep(3600)
+    # 挂起直至收到重启/关闭信号或任务被取消，空闲时不再定时唤醒事件循环
+    try:
+        await restart_event.wait()
+    finally:
+        await runner.cleanup()
+
+TEMP_FILE_MAX_AGE = 86400
+
+def sweep_temp_dir(temp_dir: str):
+    """删除 temp 目录下超过 24 小时的文件 (同步函数，在线程池中执行)"""
+    if not os.path.exists(temp_dir):
+        return
+    now = time.time()
+    # scandir 一次遍历即可取得文件类型与 mtime，无需对每个文件分别 stat
+    with os.scandir(temp_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and (now - entry.stat().st_mtime) > TEMP_FILE_MAX_AGE:
+                os.remove(entry.path)
+                logger.info("Cleaned up expired temp file: %s", entry.name)
 
 async def cleanup_temp_files():
-    """定时清理 /temp 目录下超过 24 小时的文件"""
+    """定时清理 /temp 目录下超过 24 小时的文件，以及超过保留期限的消息映射"""
     temp_dir = os.path.join(os.getcwd(), 'temp')
+    retention_days = config_loader.get('database.mapping_retention_days', 0)
+    loop = asyncio.get_running_loop()
     while True:
         try:
-            if os.path.exists(temp_dir):
-                now = time.time()
-                for fname in os.listdir(temp_dir):
-                    fpath = os.path.join(temp_dir, fname)
-                    if os.path.isfile(fpath) and (now - os.path.getmtime(fpath)) > 86400:
-                        os.remove(fpath)
-                        logger.info(f"Cleaned up expired temp file: {fname}")
+            # 目录遍历与删除均为阻塞 IO，放到线程池执行，不占用事件循环
+            await loop.run_in_executor(None, sweep_temp_dir, temp_dir)
         except Exception as e:
-            logger.error(f"Temp cleanup error: {e}")
+            logger.error("Temp cleanup error: %s", e)
+        if retention_days > 0:
+            try:
+                pruned = await db.prune_message_mappings(retention_days)
+                if pruned:
+                    logger.info("已清理 %d 条过期消息映射", pruned)
+            except Exception as e:
+                logger.error("Message mapping cleanup error: %s", e)
         await asyncio.sleep(3600)
 
-start_time = time.time()
-restart_event = asyncio.Event()
+class DeletedMessageHandler(BaseHandler):
+    """消息删除监听器 (PTB v21+ 自定义 Handler)"""
+    def __init__(self):
+        super().__init__(callback=None) # PTB v21 requires a callback in init
+
+    def check_update(self, update):
+        return getattr(update, 'deleted_message_ids', None) or None
+
+    async def handle_update(self, update, application, check_result, context):
+        await handle_message_deleted(update, context)
+
+class AdminApiServer(uvicorn.Server):
+    """不接管进程信号的 uvicorn 服务器：SIGINT/SIGTERM 由 install_signal_handlers 统一设置 restart_event，
+    否则 uvicorn 会替换掉这些处理器，收到信号时只停止 Admin API"""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        # uvicorn >= 0.29
+        yield
+
+    def install_signal_handlers(self):
+        # 旧版本 uvicorn
+        pass
+
+# 在 main() 中创建，确保绑定到实际运行的事件循环
+restart_event = None
+restart_requested = False
 background_tasks = []
 
-async def graceful_restart():
-    """优雅重启：取消所有后台任务并重新加载进程"""
+def log_task_exception(task: asyncio.Task):
+    """后台任务结束时的回调：记录异常退出，避免任务崩溃后无人察觉"""
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error("后台任务异常退出: %r", exc, exc_info=exc)
+
+def start_background_task(coro):
+    """创建后台任务并登记，关闭时统一取消"""
+    task = asyncio.create_task(coro)
+    task.add_done_callback(log_task_exception)
+    background_tasks.append(task)
+    return task
+
+def graceful_restart():
+    """优雅重启：通知主协程退出，待资源清理完毕后由入口重新加载进程"""
+    global restart_requested
     logger.info("正在触发优雅重启...")
+    restart_requested = True
     restart_event.set()
-    for task in background_tasks:
-        task.cancel()
-    # 等待一小段时间让任务清理资源
-    await asyncio.sleep(1)
-    os.execv(sys.executable, ['python'] + sys.argv)
+
+def install_signal_handlers():
+    """SIGINT/SIGTERM 经事件循环的信号管道派发，与重启共用同一条关闭路径 (但不重新加载进程)"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, restart_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows 事件循环不支持，沿用 KeyboardInterrupt
+            return
 
 async def main():
-    global start_time
-    # 再次确认赋值，防止模块加载时的时序问题
-    start_time = time.time()
-    logger.info(f"系统启动时间戳: {start_time}")
+    global restart_event
+    restart_event = asyncio.Event()
+    install_signal_handlers()
     # 初始化数据库
     await db.init_db()
     
@@ -251,52 +365,71 @@ async def main():
     token = config_loader.get('telegram.bot_token')
     proxy_url = config_loader.get('telegram.proxy_url')
     
-    # 配置请求超时时间，防止大文件获取时超时 (连接10s, 读取30s)
-    request = HTTPXRequest(connection_pool_size=8, read_timeout=30.0, connect_timeout=10.0)
-    
-    builder = Application.builder().token(token).request(request)
     if proxy_url:
-        logger.info(f"Using Telegram proxy: {proxy_url}")
         # 确保代理地址包含协议头，否则 PTB 可能会报错
         if not proxy_url.startswith(('http://', 'https://', 'socks5://')):
             proxy_url = f"http://{proxy_url}"
-        builder.proxy_url(proxy_url).get_updates_proxy_url(proxy_url)
+        logger.info(f"Using Telegram proxy: {proxy_url}")
     else:
+        proxy_url = None
         logger.warning("未配置 Telegram 代理，国内服务器可能无法连接！")
     
+    # 长轮询 getUpdates 与发送消息使用独立的连接池，避免长轮询占满连接导致发送排队
+    # 配置请求超时时间，防止大文件获取时超时 (连接10s, 读取30s)
+    pool_size = config_loader.get('telegram.connection_pool_size', 32)
+    pool_timeout = config_loader.get('telegram.pool_timeout', 8.0)
+    request = HTTPXRequest(
+        connection_pool_size=pool_size,
+        pool_timeout=pool_timeout,
+        read_timeout=30.0,
+        write_timeout=30.0,
+        connect_timeout=10.0,
+        proxy=proxy_url
+    )
+    get_updates_request = HTTPXRequest(
+        connection_pool_size=4,
+        pool_timeout=pool_timeout,
+        connect_timeout=10.0,
+        proxy=proxy_url
+    )
+    
+    builder = Application.builder().token(token).request(request).get_updates_request(get_updates_request)
+    # 默认逐条处理更新，保证 TG -> QQ 消息顺序与发送顺序一致 (与 QQ -> TG 方向一致)；
+    # 大于 1 时并发处理，媒体较慢时不阻塞后续消息，但后续文本可能先于图片到达
+    builder.concurrent_updates(config_loader.get('telegram.concurrent_updates', 1))
+    
     application = builder.build()
     
-    # 初始化同步引擎 (单例模式)
-    global_sync_engine = SyncEngine(application.bot)
+    # 初始化同步引擎 (单例模式)，保存到模块变量供事件处理函数直接使用
+    global engine
+    engine = SyncEngine(application.bot)
     
     # 注册 TG 处理器
     for handler in get_tg_handlers():
         application.add_handler(handler)
     
-    # 注册消息删除监听器 (PTB v21+ 自定义 Handler)
-    from telegram.ext import BaseHandler
-    class DeletedMessageHandler(BaseHandler):
-        def __init__(self):
-            super().__init__(callback=None) # PTB v21 requires a callback in init
-        
-        def check_update(self, update):
-            return hasattr(update, 'deleted_message_ids') and update.deleted_message_ids
-        
-        async def handle_update(self, update, application, check_result, context):
-            from handlers.tg_handler import handle_message_deleted
-            await handle_message_deleted(update, context)
-
+    # 注册消息删除监听器
     application.add_handler(DeletedMessageHandler())
     
     # 启动 TG Polling
     await application.initialize()
     await application.start()
-    updater_task = asyncio.create_task(application.updater.start_polling(drop_pending_updates=True))
-    background_tasks.append(updater_task)
+    # start_polling 在轮询启动后即返回，轮询本身由 updater 内部任务维持
+    await application.updater.start_polling(drop_pending_updates=True)
+    
+    # 启动事件队列与媒体转发队列 (需先于 QQ Webhook 就绪)
+    global message_queue, notice_queue, media_queue
+    message_queue = asyncio.Queue()
+    notice_queue = asyncio.Queue()
+    media_queue = asyncio.Queue(maxsize=MEDIA_QUEUE_SIZE)
+    start_background_task(process_event_queue(message_queue))
+    start_background_task(process_event_queue(notice_queue))
+    # 多个消费者并发转发媒体，并发上限与 SyncEngine 的媒体信号量一致
+    for _ in range(config_loader.get('sync.max_concurrent_media', 8)):
+        start_background_task(process_media_queue())
     
     # 启动 QQ Webhook
-    webhook_task = asyncio.create_task(start_qq_webhook())
-    background_tasks.append(webhook_task)
+    start_background_task(start_qq_webhook())
     
     # 启动 Admin API (使用 uvicorn 的 serve 方法在协程中运行)
     from fastapi.staticfiles import StaticFiles
@@ -304,32 +437,69 @@ async def main():
         admin_app.mount("/", StaticFiles(directory="web", html=True), name="web")
     
     config = uvicorn.Config(admin_app, host=config_loader.get('server.host', '0.0.0.0'), port=config_loader.get('server.admin_api_port', 8081), log_level="info")
-    server = uvicorn.Server(config)
-    api_task = asyncio.create_task(server.serve())
-    background_tasks.append(api_task)
+    server = AdminApiServer(config)
+    start_background_task(server.serve())
     
     # 启动临时文件清理任务
-    cleanup_task = asyncio.create_task(cleanup_temp_files())
-    background_tasks.append(cleanup_task)
+    start_background_task(cleanup_temp_files())
     
     logger.info("TQSync is running...")
     
     # 发送启动成功通知
-    engine = SyncEngine.get_instance()
     await engine.send_startup_notification()
     
-    # 等待重启信号或任务结束
+    # 等待重启信号，或任一后台任务意外结束 (如 Webhook 端口被占用)，避免进程半瘫痪地继续运行
+    restart_waiter = asyncio.ensure_future(restart_event.wait())
     try:
-        await restart_event.wait()
+        done, _ = await asyncio.wait([restart_waiter, *background_tasks], return_when=asyncio.FIRST_COMPLETED)
+        if restart_waiter not in done:
+            logger.error("后台任务意外结束，正在关闭 TQSync...")
     except asyncio.CancelledError:
         pass
     finally:
+        restart_waiter.cancel()
         logger.info("TQSync 正在关闭...")
-        # 确保数据库连接关闭
-        await db.close()
+        # 先停止 Telegram 长轮询，再停止应用 (顺序不可颠倒)
+        try:
+            if application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+        except Exception as e:
+            logger.error("停止 Telegram 应用失败: %s", e)
+        # 取消所有后台任务并等待其退出
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        # 合并发送协程、OneBot 连接池与数据库相互独立，并发关闭，单个失败不影响其他
+        results = await asyncio.gather(
+            engine.close(),
+            onebot_client.close(),
+            db.close(),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("关闭资源失败: %s", result)
+
+def install_uvloop():
+    """如已安装 uvloop (仅 Linux/macOS)，将其设为事件循环策略，需在创建事件循环前调用"""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("已启用 uvloop 事件循环")
 
 if __name__ == '__main__':
+    # 让其他模块中的 `from main import ...` 指向当前模块，而不是重新导入一份副本
+    sys.modules.setdefault('main', sys.modules[__name__])
+    install_uvloop()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Stopped by user")
+    if restart_requested:
+        # 事件循环已完全退出，此时重新加载进程
+        os.execv(sys.executable, [sys.executable] + sys.argv)
@@ -0,0 +1,26 @@
+import json
+
+# 优先使用 orjson (C/Rust 实现)，其次 ujson，最后回退到标准库 json
+try:
+    import orjson
+
+    def json_loads(data):
+        """解析 JSON，直接接受 bytes，省去一次 UTF-8 解码"""
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> str:
+        """序列化为 JSON 字符串 (aiohttp 的 json_serialize 需要返回 str)"""
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+    try:
+        import ujson
+
+        json_loads = ujson.loads
+
+        def json_dumps(obj) -> str:
+            return ujson.dumps(obj, ensure_ascii=False)
+    except ImportError:
+        json_loads = json.loads
+
+        def json_dumps(obj) -> str:
+            return json.dumps(obj, ensure_ascii=False)
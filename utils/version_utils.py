@@ -1,5 +1,6 @@
 import subprocess
 import os
+from datetime import datetime
 
 def get_version():
     """通过 Git 提交次数动态计算版本号"""
@@ -33,3 +34,16 @@ def get_full_version_string():
     version = get_version()
     commit_hash = get_git_commit_hash()
     return f"v{version} ({commit_hash})"
+
+def get_last_update_time():
+    """获取最后更新时间 (最近一次提交时间，非 Git 仓库时回退到 main.py 的修改时间)"""
+    try:
+        result = subprocess.run(['git', 'log', '-1', '--format=%ci'],
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip().split('+')[0].strip()
+    except Exception:
+        try:
+            mtime = os.path.getmtime('main.py')
+            return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+        except OSError:
+            return "Unknown"